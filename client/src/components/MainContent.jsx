@@ -251,6 +251,7 @@ const PodcastSection = ({ onOpenPodcast }) => {
 
 const PodcastDetail = ({ podcastId, onBack }) => {
     const [data, setData] = useState(null);
+    const [loadingMore, setLoadingMore] = useState(false);
     const { playSong } = usePlayer();
 
     useEffect(() => {
@@ -260,6 +261,16 @@ const PodcastDetail = ({ podcastId, onBack }) => {
             .catch(console.error);
     }, [podcastId]);
 
+    const loadMore = () => {
+        if (!data?.next_cursor || loadingMore) return;
+        setLoadingMore(true);
+        fetch(`${API_URL}/api/podcasts/${podcastId}?cursor=${data.next_cursor}`)
+            .then(res => res.json())
+            .then(page => setData(prev => ({ ...prev, episodes: [...prev.episodes, ...(page.episodes || [])], next_cursor: page.next_cursor })))
+            .catch(console.error)
+            .finally(() => setLoadingMore(false));
+    };
+
     if (!data) return <div className="text-gray-500 p-8">Loading episodes...</div>;
 
     return (
@@ -290,6 +301,12 @@ const PodcastDetail = ({ podcastId, onBack }) => {
                     </div>
                 ))}
             </div>
+
+            {data.next_cursor && (
+                <button onClick={loadMore} disabled={loadingMore} className="w-full my-6 py-3 rounded-xl bg-white/5 hover:bg-white/10 text-gray-300 font-medium transition disabled:opacity-50">
+                    {loadingMore ? "Loading..." : "Load more episodes"}
+                </button>
+            )}
         </div>
     );
 };
@@ -637,7 +654,7 @@ const ProfileView = ({ user, targetId, setViewingProfileId, onLoginClick, onLogo
 
 // --- MAIN CONTROLLER ---
 export default function MainContent({ activeTab, setActiveTab, searchQuery, user, onSearch, onMenuClick, onLoginClick, onLogoutClick, profilePic, setProfilePic }) {
-    const { playSong, currentSong, isPlaying, likedSongs, toggleLike, playlists, addToPlaylist, createPlaylist, playPlaylist, deletePlaylist, removeFromPlaylist, addToQueue } = usePlayer();
+    const { playSong, currentSong, isPlaying, likedSongs, toggleLike, playlists, addToPlaylist, createPlaylist, playPlaylist, deletePlaylist, removeFromPlaylist, addToQueue, playFlow } = usePlayer();
 
     const [feed, setFeed] = useState([]);
     const [header, setHeader] = useState("Home");
@@ -771,18 +788,6 @@ export default function MainContent({ activeTab, setActiveTab, searchQuery, user
         return () => { mounted = false; };
     }, [activeTab]);
 
-    const playFlow = async () => {
-        try {
-            const token = localStorage.getItem('token');
-            const headers = token ? { 'Authorization': `Bearer ${token.replace(/^"|"$/g, '')}` } : {};
-            const res = await fetch(`${API_URL}/api/flow`, { headers });
-            const data = await res.json();
-            if (data && data.length > 0) {
-                playSong(data[0], data);
-            }
-        } catch (e) { console.error("Flow error", e); }
-    };
-
     const renderContent = () => {
         if (activeTab === 'Profile') return <ProfileView user={user} targetId={viewingProfileId} setViewingProfileId={(id) => { setViewingProfileId(id); if (id) setActiveTab('Profile'); }} onLoginClick={onLoginClick} onLogoutClick={onLogoutClick} setProfilePic={setProfilePic} />;
         if (activeTab === 'Podcast') return <PodcastSection onOpenPodcast={(id) => setActiveTab(`Podcast:${id}`)} />;
@@ -87,7 +87,7 @@ const extractColor = (imgSrc) => {
         img.crossOrigin = "Anonymous";
 
         // Use the centralized API_URL directly
-        const proxyUrl = `${API_URL}/api/proxy_image?url=${encodeURIComponent(getImageUrl(imgSrc))}`;
+        const proxyUrl = `${API_URL}/api/proxy_image?url=${encodeURIComponent(getImageUrl(imgSrc))}&size=64`;
         console.log("🎨 Player.extractColor request:", proxyUrl);
         img.src = proxyUrl;
 
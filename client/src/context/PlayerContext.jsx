@@ -45,6 +45,8 @@ export const PlayerProvider = ({ children }) => {
     });
 
     const audioRef = useRef(new Audio());
+    // Cursor of the next /api/flow page while the queue is a Flow mix (see playFlow)
+    const flowCursorRef = useRef(null);
     const audioContextRef = useRef(null);
     const analyserRef = useRef(null);
     const sourceRef = useRef(null);
@@ -199,6 +201,7 @@ export const PlayerProvider = ({ children }) => {
         if (currentSong?.id === cleanSong.id && audioRef.current.src && !forcePlay) return togglePlay();
 
         if (sourceList && Array.isArray(sourceList)) {
+            flowCursorRef.current = null; // A new list ends any Flow session
             // Sanitize list too
             const cleanList = sourceList.map(sanitizeSong);
             setQueue(cleanList);
@@ -278,10 +281,47 @@ export const PlayerProvider = ({ children }) => {
         }
     };
 
+    // --- FLOW (SERVER-SIDE INFINITE MIX) ---
+    const fetchFlowPage = useCallback(async (cursor = null) => {
+        const token = getToken();
+        const res = await fetch(`${API_URL}/api/flow${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ''}`, {
+            headers: token ? { 'Authorization': `Bearer ${token}` } : {}
+        });
+        const tracks = await res.json();
+        return { tracks: Array.isArray(tracks) ? tracks : [], cursor: res.headers.get('X-Flow-Cursor') };
+    }, [getToken]);
+
+    const playFlow = async () => {
+        try {
+            const page = await fetchFlowPage();
+            if (page.tracks.length > 0) {
+                playSong(page.tracks[0], page.tracks);
+                flowCursorRef.current = page.cursor;
+            }
+        } catch (e) { console.error("Flow error", e); }
+    };
+
     // --- REFINED NEXT SONG (TASTE-BASED AUTOPLAY) ---
     const nextSong = useCallback(async () => {
         if (queue.length === 0 || currentIndex === -1) return;
 
+        // End of a Flow page: the next page of the same mix (no repeats)
+        if (currentIndex === queue.length - 1 && flowCursorRef.current) {
+            try {
+                const page = await fetchFlowPage(flowCursorRef.current);
+                const known = new Set(queue.map(s => s.id));
+                const fresh = page.tracks.filter(s => !known.has(s.id));
+                if (fresh.length > 0) {
+                    const newQueue = [...queue, ...fresh];
+                    playSong(fresh[0], newQueue);
+                    flowCursorRef.current = page.cursor;
+                    return;
+                }
+            } catch (e) {
+                console.error("Flow page failed", e);
+            }
+        }
+
         // If at the end of manual queue, fetch recommendations
         if (currentIndex === queue.length - 1 && currentSong) {
             notify("Queue ended. Finding more you'll like...", 'info');
@@ -307,7 +347,7 @@ export const PlayerProvider = ({ children }) => {
 
         const nextIndex = (currentIndex + 1) % queue.length;
         playSong(queue[nextIndex], null, true); // Force play next
-    }, [queue, currentIndex, currentSong, getToken, notify]);
+    }, [queue, currentIndex, currentSong, getToken, notify, fetchFlowPage]);
 
     // --- PREVIOUS SONG (YOUTUBE LOGIC) ---
     const prevSong = useCallback(() => {
@@ -608,7 +648,7 @@ export const PlayerProvider = ({ children }) => {
         <PlayerContext.Provider value={{
             currentSong, isPlaying, playSong, togglePlay, nextSong, prevSong, audioRef, analyserRef,
             playlists, createPlaylist, addToPlaylist, deletePlaylist, removeFromPlaylist, fetchPlaylistTracks, playPlaylist, likedSongs, toggleLike, saveProgress,
-            queue, addToQueue, currentIndex, notification, notify, apiFetch,
+            queue, addToQueue, currentIndex, notification, notify, apiFetch, playFlow,
             volume, setVolume, isMuted, toggleMute, repeatMode, setRepeatMode, isShuffle, setIsShuffle,
             volume, setVolume, isMuted, toggleMute, repeatMode, setRepeatMode, isShuffle, setIsShuffle,
             isExpanded, setIsExpanded
@@ -8,6 +8,7 @@ from flask_limiter.util import get_remote_address
 from server.config import Config
 from server.models import db
 from server.extensions import limiter, jwt
+from server.track_search import setup_track_search
 from server.routes.auth import auth_bp
 from server.routes.player import player_bp
 from server.routes.playlists import playlists_bp
@@ -123,5 +124,37 @@ with app.app_context():
     except Exception as e: 
         print(f"Skipping banner_url (exists or error): {e}")
 
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(db.text('ALTER TABLE track ADD COLUMN content_hash VARCHAR(64)'))
+            conn.execute(db.text('CREATE UNIQUE INDEX IF NOT EXISTS ix_track_content_hash ON track (content_hash)'))
+            print("Added content_hash column")
+    except Exception as e:
+        print(f"Skipping content_hash (exists or error): {e}")
+
+    # content_hash used to get a plain index: make it unique so concurrent uploads of one file can't both insert
+    try:
+        indexes = {ix['name']: ix for ix in db.inspect(db.engine).get_indexes('track')}
+        if not indexes.get('ix_track_content_hash', {}).get('unique'):
+            with db.engine.begin() as conn:
+                conn.execute(db.text('DROP INDEX IF EXISTS ix_track_content_hash'))
+                conn.execute(db.text('CREATE UNIQUE INDEX ix_track_content_hash ON track (content_hash)'))
+                print("Made content_hash unique")
+    except Exception as e:
+        print(f"Skipping unique content_hash (duplicate uploads or error): {e}")
+
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(db.text('ALTER TABLE track ADD COLUMN rendition_id VARCHAR(64)'))
+            print("Added rendition_id column")
+    except Exception as e:
+        print(f"Skipping rendition_id (exists or error): {e}")
+
+    # Full-text index over the track catalog (FTS5 on SQLite, tsvector + GIN on Postgres)
+    try:
+        setup_track_search()
+    except Exception as e:
+        print(f"Skipping track search index (falling back to LIKE): {e}")
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,381 @@
+"""
+Async streaming mode.
+
+/api/stream/<video_id> is relayed on asyncio so one worker can hold thousands of listeners
+at once, uploaded tracks and cached segments are read from disk the same way. Relayed bytes
+are written back to the segment cache segment by segment, like the sync route does. Every other
+route is handed to the regular Flask app, on a pool of ASYNC_FLASK_THREADS threads.
+
+    gunicorn server.asgi:app -k uvicorn.workers.UvicornWorker
+
+The default `gunicorn server.wsgi:app` (sync workers) keeps working unchanged.
+"""
+import os
+import re
+import json
+import time
+import asyncio
+
+import httpx
+from a2wsgi import WSGIMiddleware
+
+from server.app import app as flask_app
+from server.config import Config
+from server.resolver import get_stream_url, stream_url_cache, base_type, AUDIO_HEADERS
+from server.upstream import Deadline
+from server.metrics import metrics, host_label
+from server.segment_cache import segment_cache, parse_range
+from server.uploads import find_local_track
+from server.routes.player import AUDIO_MIMETYPES
+
+# Not asgiref's WsgiToAsgi: that runs every request on one thread per worker
+flask_asgi = WSGIMiddleware(flask_app, workers=Config.ASYNC_FLASK_THREADS)
+
+STREAM_PATH = re.compile(r'^/api/stream/([^/]+)$')
+
+# Same headers Flask adds in add_security_headers + the CORS header the sync routes set
+BASE_HEADERS = [
+    (b'access-control-allow-origin', b'*'),
+    (b'x-content-type-options', b'nosniff'),
+    (b'x-frame-options', b'DENY'),
+    (b'strict-transport-security', b'max-age=31536000; includeSubDomains')
+]
+
+# One pooled client per worker event loop, created on first use
+_client = None
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            verify=False,
+            follow_redirects=True,
+            timeout=httpx.Timeout(Config.UPSTREAM_READ_TIMEOUT, connect=Config.UPSTREAM_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=Config.ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=Config.UPSTREAM_POOL_SIZE * 4
+            )
+        )
+    return _client
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        match = STREAM_PATH.match(scope['path'])
+        if match:
+            return await stream_track(scope, receive, send, match.group(1))
+
+    return await flask_asgi(scope, receive, send)
+
+async def lifespan(receive, send):
+    global _client
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _client is not None:
+                await _client.aclose()
+                _client = None
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+# --- helpers ---
+
+def request_header(scope, name):
+    name = name.lower().encode('latin-1')
+    for key, value in scope['headers']:
+        if key == name:
+            return value.decode('latin-1')
+    return None
+
+async def send_json(send, payload, status):
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': BASE_HEADERS + [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+async def wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+async def send_stream(receive, send, status, headers, chunks):
+    """Send an async iterator of bytes as the response body, stop as soon as either side goes away."""
+    async def pump():
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        async for chunk in chunks:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    pump_task = asyncio.ensure_future(pump())
+    watch_task = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await asyncio.wait([pump_task, watch_task], return_when=asyncio.FIRST_COMPLETED)
+        if pump_task.done():
+            pump_task.result()  # Surface upstream errors in the log
+    finally:
+        for task in (pump_task, watch_task):
+            task.cancel()
+        await asyncio.gather(pump_task, watch_task, return_exceptions=True)
+        await chunks.aclose()
+
+async def relay(resp, receive, send, status, headers, body=None):
+    """
+    Pipe an upstream body to the client, stop as soon as either side goes away.
+    `body` replaces resp's own byte iterator (see resumable_body).
+    """
+    try:
+        await send_stream(receive, send, status, headers, body if body is not None else resp.aiter_bytes(65536))
+    finally:
+        await resp.aclose()
+
+async def file_chunks(path, start, end, chunk_size=262144):
+    """Bytes start..end of a file, read off the event loop."""
+    f = await asyncio.to_thread(open, path, 'rb')
+    try:
+        await asyncio.to_thread(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(chunk_size, remaining))
+            if not chunk: break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+async def segment_chunks(video_id, start, end, size):
+    """Bytes start..end from the segment cache (the caller checked it covers them), read off the event loop."""
+    def fetch(first, last):
+        raise IOError(f"Segments of {video_id} were evicted mid-read")
+    segments = segment_cache.read(video_id, start, end, size, fetch)
+    try:
+        while True:
+            chunk = await asyncio.to_thread(next, segments, None)
+            if chunk is None: return
+            yield chunk
+    finally:
+        segments.close()
+
+async def serve_from_disk(scope, receive, send, size, content_type, chunks_for, source, started, extra_headers=()):
+    """Range/206 response for a body of `size` bytes on our disk, chunks_for(start, end) reads it."""
+    range_header = request_header(scope, 'Range')
+    span = parse_range(range_header, size)
+    if not span:
+        await send({'type': 'http.response.start', 'status': 416, 'headers': BASE_HEADERS + [(b'content-range', f'bytes */{size}'.encode())]})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    start, end = span
+    headers = BASE_HEADERS + list(extra_headers) + [
+        (b'content-type', content_type.encode('latin-1')),
+        (b'content-length', str(end - start + 1).encode()),
+        (b'accept-ranges', b'bytes')
+    ]
+    if range_header:
+        headers.append((b'content-range', f'bytes {start}-{end}/{size}'.encode()))
+
+    async def counted(chunks):
+        sent = 0
+        try:
+            async for chunk in chunks:
+                if not sent:
+                    metrics.observe('mewzy_stream_ttfb_seconds', time.monotonic() - started, source=source)
+                sent += len(chunk)
+                yield chunk
+        finally:
+            metrics.inc('mewzy_stream_bytes_total', sent, source=source)
+            await chunks.aclose()
+
+    await send_stream(receive, send, 206 if range_header else 200, headers, counted(chunks_for(start, end)))
+
+def content_span(resp):
+    """(first, last, size) of the bytes in an upstream response, None where upstream didn't say."""
+    match = re.match(r'^bytes (\d+)-(\d+)/(\d+|\*)$', resp.headers.get('Content-Range', ''))
+    if match:
+        size = int(match.group(3)) if match.group(3) != '*' else None
+        return int(match.group(1)), int(match.group(2)), size
+    length = resp.headers.get('Content-Length', '')
+    if resp.status_code == 200 and length.isdigit():
+        return 0, int(length) - 1, int(length)
+    return 0, None, None
+
+async def open_range(url, headers):
+    """206 response for a Range request, None if the connection failed or upstream refused."""
+    client = get_client()
+    try:
+        resp = await client.send(client.build_request('GET', url, headers=headers), stream=True)
+    except httpx.HTTPError:
+        return None
+    if resp.status_code == 206:
+        return resp
+    await resp.aclose()
+    return None
+
+async def resumable_body(resp, video_id, url, errors, started):
+    """
+    resp's body, continued with a Range request from the next byte when upstream breaks off
+    partway: the same URL first, then a fresh resolution. Mirrors UpstreamAudio.stream.
+    """
+    first, last, size = content_span(resp)
+    offset = first
+    reconnects = 0
+    try:
+        while True:
+            try:
+                host = host_label(url)
+                async for chunk in resp.aiter_bytes(65536):
+                    if offset == first:
+                        metrics.observe('mewzy_stream_ttfb_seconds', time.monotonic() - started, source='upstream')
+                    offset += len(chunk)
+                    metrics.inc('mewzy_upstream_bytes_total', len(chunk), host=host)
+                    yield chunk
+                if last is None or offset > last:
+                    return
+                raise IOError(f"Upstream closed at byte {offset} of {last + 1}")
+            except (httpx.HTTPError, OSError) as e:
+                await resp.aclose()
+                if last is None or reconnects >= Config.STREAM_MAX_RECONNECTS:
+                    raise
+                reconnects += 1
+                metrics.inc('mewzy_stream_reconnects_total', host=host_label(url))
+                print(f"[AsyncPlayer] Upstream for {video_id} dropped at byte {offset} ({e}), reconnecting ({reconnects}/{Config.STREAM_MAX_RECONNECTS})...")
+
+            headers = dict(AUDIO_HEADERS, Range=f'bytes={offset}-{last}')
+            retry = await open_range(url, headers) if reconnects == 1 else None
+            if retry is None:
+                url, _ = await asyncio.to_thread(get_stream_url, video_id, errors, True, Deadline(Config.STREAM_RESOLVE_BUDGET))
+                retry = await open_range(url, headers) if url else None
+                if retry is None:
+                    raise IOError(f"Could not resume {video_id} at byte {offset}")
+            resp = retry
+
+            new_size = content_span(resp)[2]
+            if size is not None and new_size is not None and new_size != size:
+                await resp.aclose()
+                raise IOError(f'Upstream now serves a different file ({new_size} bytes, was {size})')
+    finally:
+        metrics.inc('mewzy_stream_bytes_total', offset - first, source='upstream')
+        await resp.aclose()
+
+async def write_through(chunks, video_id, offset, size):
+    """
+    Pass on `chunks` (a body starting at byte `offset` of a `size`-byte file) and write every
+    complete, aligned segment in it back to the segment cache, off the event loop.
+    """
+    seg = segment_cache.segment_size
+    def store(index, data):
+        if not segment_cache.has_segment(video_id, size, index):
+            segment_cache.write_segment(video_id, size, index, data)
+
+    buffer = bytearray()
+    buffer_start = -(-offset // seg) * seg  # First segment boundary at or after offset, the part before it is incomplete
+    received = offset
+    try:
+        async for chunk in chunks:
+            yield chunk
+            buffer += chunk[max(0, buffer_start - received):]
+            received += len(chunk)
+            while buffer:
+                length = min(seg, size - buffer_start)
+                if len(buffer) < length: break
+                await asyncio.to_thread(store, buffer_start // seg, bytes(buffer[:length]))
+                del buffer[:length]
+                buffer_start += length
+    finally:
+        await chunks.aclose()
+
+# --- routes ---
+
+async def stream_track(scope, receive, send, video_id):
+    errors = []
+    started = time.monotonic()
+    try:
+        # Sanitize video_id
+        video_id = video_id.replace('*', '').strip()
+
+        # Uploaded tracks and ranges already in the segment cache are served from disk, no upstream involved
+        local_path = find_local_track(video_id)
+        if local_path:
+            return await serve_from_disk(
+                scope, receive, send, os.path.getsize(local_path),
+                AUDIO_MIMETYPES.get(local_path.rsplit('.', 1)[1], 'audio/mpeg'),
+                lambda start, end: file_chunks(local_path, start, end), 'local', started,
+                extra_headers=[(b'cache-control', b'public, max-age=86400')]
+            )
+        meta = segment_cache.meta(video_id)
+        if meta:
+            span = parse_range(request_header(scope, 'Range'), meta['size'])
+            if not span or segment_cache.covers(video_id, meta['size'], *span):  # (416 for a bad range)
+                return await serve_from_disk(
+                    scope, receive, send, meta['size'], meta['content_type'],
+                    lambda start, end: segment_chunks(video_id, start, end, meta['size']), 'cache', started
+                )
+
+        # 1. Resolve (or reuse) the upstream audio URL. Resolution is blocking, keep it off the loop.
+        url, from_cache = await asyncio.to_thread(get_stream_url, video_id, errors, False, Deadline(Config.STREAM_RESOLVE_BUDGET))
+        if not url:
+            return await send_json(send, {'error': 'All streaming strategies failed', 'details': errors}, 500)
+
+        # 2. Prepare headers with browser impersonation
+        proxy_headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': '*/*',
+            'Referer': 'https://www.youtube.com/'
+        }
+        range_header = request_header(scope, 'Range')
+        if range_header:
+            proxy_headers['Range'] = range_header
+
+        # 3. Stream proxy
+        client = get_client()
+        resp = await client.send(client.build_request('GET', url, headers=proxy_headers), stream=True)
+
+        # A cached URL can be revoked before its expiry, resolve once more before giving up
+        if resp.status_code in [403, 410] and from_cache:
+            print(f"[AsyncPlayer] Cached URL for {video_id} rejected ({resp.status_code}), re-resolving...")
+            await resp.aclose()
+            url, _ = await asyncio.to_thread(get_stream_url, video_id, errors, True, Deadline(Config.STREAM_RESOLVE_BUDGET))
+            if not url:
+                return await send_json(send, {'error': 'All streaming strategies failed', 'details': errors}, 500)
+            resp = await client.send(client.build_request('GET', url, headers=proxy_headers), stream=True)
+
+        if resp.status_code in [403, 410]:
+            await resp.aclose()
+            stream_url_cache.delete(video_id)
+            return await send_json(send, {'error': f'Upstream Error ({resp.status_code})', 'url': url}, 500)
+
+        content_type = resp.headers.get('Content-Type', 'audio/mpeg')
+        headers = BASE_HEADERS + [
+            (b'content-type', content_type.encode('latin-1')),
+            (b'accept-ranges', b'bytes')
+        ]
+        for name in ('Content-Length', 'Content-Range'):
+            if resp.headers.get(name):
+                headers.append((name.lower().encode(), resp.headers[name].encode('latin-1')))
+
+        body = resumable_body(resp, video_id, url, errors, started)
+        first, _, size = content_span(resp)
+        if size:
+            # Fill the segment cache as we relay, so the next listener of these bytes is served from disk
+            if meta and (meta['size'] != size or base_type(meta['content_type']) != base_type(content_type)):
+                print(f"[AsyncPlayer] {video_id}: upstream now serves another file, dropping its cached segments")
+                await asyncio.to_thread(segment_cache.drop, video_id)
+                meta = None
+            if not meta:
+                await asyncio.to_thread(segment_cache.save_meta, video_id, size, content_type)
+            body = write_through(body, video_id, first, size)
+
+        await relay(resp, receive, send, resp.status_code, headers, body=body)
+
+    except Exception as e:
+        print(f"[AsyncPlayer] Stream Error: {e}")
+        try:
+            await send_json(send, {'error': str(e), 'details': errors}, 500)
+        except Exception:
+            pass  # Response already started, nothing more we can tell the client
@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: locking across processes is skipped
+    fcntl = None
+
+from server.config import Config
+
+
+def atomic_write(path, data):
+    """
+    Write bytes (or str, as UTF-8) to path via a temp file of this process and thread, then
+    os.replace it: readers in every worker see the old file or the new one, never half of one.
+    Raises OSError, after removing the temp file.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+
+class DiskLRU:
+    """
+    Size bound for a cache folder that all workers write to. Call wrote(nbytes) after each write:
+    every max_bytes/20 written bytes it drops the least recently used files (oldest mtime, so
+    readers should bump it) until the folder is back under 90% of max_bytes.
+    Only files ending in `suffix` count when given; temp files never do.
+    """
+
+    def __init__(self, folder, max_bytes, label, suffix=None):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.label = label
+        self.suffix = suffix
+        self._lock = threading.Lock()
+        self._written = 0
+
+    def wrote(self, nbytes):
+        with self._lock:
+            self._written += nbytes
+            due = self._written >= self.max_bytes // 20
+            if due: self._written = 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.folder):
+            for name in names:
+                if name.endswith('.tmp') or (self.suffix and not name.endswith(self.suffix)): continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        if total <= self.max_bytes: return
+        target = self.max_bytes * 0.9
+        files.sort()
+        for _, size, path in files:
+            if total <= target: break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        print(f"[{self.label}] Evicted down to {total / 1048576:.1f} MiB")
+
+
+class SharedCache:
+    """
+    Small TTL cache shared between gunicorn workers.
+    Entries live in memory for the fast path and as JSON files under
+    Config.CACHE_FOLDER/<namespace> so every worker (and a restarted one) sees them.
+    """
+
+    def __init__(self, namespace, max_entries=1024):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.folder = os.path.join(Config.CACHE_FOLDER, namespace)
+        os.makedirs(self.folder, exist_ok=True)
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _path(self, key):
+        digest = hashlib.sha1(str(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, f"{digest}.json")
+
+    def _remember(self, key, expires_at, value):
+        with self._lock:
+            self._memory[key] = (expires_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit:
+                if hit[0] > now:
+                    self._memory.move_to_end(key)
+                    return hit[1]
+                del self._memory[key]
+
+        return self.get_from_disk(key, default)
+
+    def get_from_disk(self, key, default=None):
+        """Like get(), but skips this worker's memory: for entries other workers keep updating."""
+        now = time.time()
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return default
+
+        if entry.get('key') != key or entry.get('expires', 0) <= now:
+            self._unlink(path)
+            return default
+
+        self._remember(key, entry['expires'], entry['value'])
+        return entry['value']
+
+    def set(self, key, value, ttl):
+        if ttl <= 0: return
+        expires_at = time.time() + ttl
+        self._remember(key, expires_at, value)
+
+        try:
+            atomic_write(self._path(key), json.dumps({'key': key, 'expires': expires_at, 'value': value}))
+        except OSError as e:
+            print(f"[Cache:{self.namespace}] Write failed for {key}: {e}")
+            return
+
+        self._writes += 1
+        if self._writes % 64 == 0:
+            self._prune()
+
+    def delete(self, key):
+        with self._lock:
+            self._memory.pop(key, None)
+        self._unlink(self._path(key))
+
+    def _unlink(self, path):
+        try: os.remove(path)
+        except OSError: pass
+
+    def _prune(self):
+        # Keep the on-disk side bounded too: drop the oldest files beyond max_entries
+        try:
+            entries = [e for e in os.scandir(self.folder) if e.name.endswith('.json')]
+            if len(entries) <= self.max_entries: return
+            entries.sort(key=lambda e: e.stat().st_mtime)
+        except OSError:
+            return  # Another worker pruned under us, try again next time
+        for e in entries[:len(entries) - self.max_entries]:
+            self._unlink(e.path)
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one execution.
+    The first caller runs fn, everyone who arrives while it runs waits and gets
+    the same result (or the same exception).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn, timeout=None):
+        """Result of fn() for key. Followers give up with TimeoutError after `timeout` seconds."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+
+        if not leader:
+            if not call['done'].wait(timeout):
+                raise TimeoutError(f"Timed out waiting for in-flight call {key}")
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+
+        try:
+            call['result'] = fn()
+            return call['result']
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+
+# Background refreshes of every SWRCache in this worker, created on first use
+_refresh_executor = None
+_refresh_executor_lock = threading.Lock()
+
+def _get_refresh_executor():
+    global _refresh_executor
+    with _refresh_executor_lock:
+        if _refresh_executor is None:
+            _refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='swr')
+        return _refresh_executor
+
+
+class SWRCache:
+    """
+    SharedCache with stale-while-revalidate. An entry is fresh for `ttl` seconds, after that
+    it is still served for up to `stale_ttl` seconds while one background refresh replaces it.
+    Misses are coalesced: concurrent callers for the same key share one fetch.
+    """
+
+    def __init__(self, namespace, ttl, stale_ttl, max_entries=1024):
+        self.cache = SharedCache(namespace, max_entries=max_entries)
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._flights = SingleFlight()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch):
+        """Cached value for key, calling fetch() on a miss. Exceptions from fetch() are not cached."""
+        entry = self.cache.get(key)
+        if entry is not None:
+            if entry['fresh_until'] <= time.time():
+                self._refresh_later(key, fetch)
+            return entry['value']
+        return self._flights.do(key, lambda: self._fetch(key, fetch))
+
+    def _fetch(self, key, fetch):
+        value = fetch()
+        self.cache.set(key, {'value': value, 'fresh_until': time.time() + self.ttl}, self.ttl + self.stale_ttl)
+        return value
+
+    def _refresh_later(self, key, fetch):
+        with self._lock:
+            if key in self._refreshing: return
+            self._refreshing.add(key)
+        _get_refresh_executor().submit(self._refresh, key, fetch)
+
+    def _refresh(self, key, fetch):
+        try:
+            self._flights.do(key, lambda: self._fetch(key, fetch))
+        except Exception as e:
+            print(f"[Cache:{self.cache.namespace}] Background refresh of {key} failed: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+class FileLock:
+    """
+    Advisory lock shared by all workers on the instance (flock on CACHE_FOLDER/locks/<name>).
+    Waits up to `timeout` seconds; `acquired` / `waited` tell the caller what happened.
+    Without fcntl it is a no-op that always "acquires".
+    """
+
+    def __init__(self, name, timeout=10, poll=0.05):
+        folder = os.path.join(Config.CACHE_FOLDER, 'locks')
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, hashlib.sha1(name.encode('utf-8')).hexdigest() + '.lock')
+        self.timeout = timeout
+        self.poll = poll
+        self.acquired = False
+        self.waited = False
+        self._fd = None
+
+    def __enter__(self):
+        if fcntl is None:
+            self.acquired = True
+            return self
+        self._fd = os.open(self.path, os.O_CREAT | os.O_RDWR)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fcntl.flock(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                self.acquired = True
+                return self
+            except OSError:
+                self.waited = True
+                if time.monotonic() >= deadline:
+                    return self
+                time.sleep(self.poll)
+
+    def __exit__(self, *exc):
+        if self._fd is not None:
+            if self.acquired:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        return False
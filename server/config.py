@@ -18,6 +18,138 @@ class Config:
     JWT_HEADER_TYPE = 'Bearer'
     
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
-    
+
     # Ensure upload folder exists
     os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+
+    # Shared on-disk cache (visible to every gunicorn worker on the instance)
+    CACHE_FOLDER = os.getenv('CACHE_FOLDER', os.path.join(os.getcwd(), 'cache'))
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+
+    # Resolved stream URLs: expiry comes from the URL itself when it carries one
+    STREAM_URL_DEFAULT_TTL = int(os.getenv('STREAM_URL_DEFAULT_TTL', 300))
+    STREAM_URL_MAX_TTL = int(os.getenv('STREAM_URL_MAX_TTL', 6 * 3600))
+    STREAM_URL_EXPIRY_MARGIN = int(os.getenv('STREAM_URL_EXPIRY_MARGIN', 120))
+
+    # Strategy racing: how many upstreams one resolution may hit at once,
+    # and how long to wait on the current leader before hedging with the next
+    RESOLVER_POOL_SIZE = int(os.getenv('RESOLVER_POOL_SIZE', 32))
+    RESOLVER_MAX_PARALLEL = int(os.getenv('RESOLVER_MAX_PARALLEL', 4))
+    RESOLVER_HEDGE_DELAY = float(os.getenv('RESOLVER_HEDGE_DELAY', 0.75))
+
+    # Upstream health: EWMA smoothing, consecutive failures before a host's circuit
+    # opens, and the (doubling) cooldown before a half-open probe is allowed
+    UPSTREAM_EWMA_ALPHA = float(os.getenv('UPSTREAM_EWMA_ALPHA', 0.3))
+    UPSTREAM_BREAKER_THRESHOLD = int(os.getenv('UPSTREAM_BREAKER_THRESHOLD', 3))
+    UPSTREAM_BREAKER_COOLDOWN = float(os.getenv('UPSTREAM_BREAKER_COOLDOWN', 30))
+    UPSTREAM_BREAKER_MAX_COOLDOWN = float(os.getenv('UPSTREAM_BREAKER_MAX_COOLDOWN', 600))
+
+    # Pooled keep-alive HTTP sessions for upstream calls (per host, per worker)
+    UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 16))
+    UPSTREAM_MAX_HOSTS = int(os.getenv('UPSTREAM_MAX_HOSTS', 64))
+    UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3.05))
+    UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', 10))
+
+    # Async streaming mode (server/asgi.py): upstream connections one worker may hold open,
+    # threads running the Flask routes next to the event loop
+    ASYNC_MAX_CONNECTIONS = int(os.getenv('ASYNC_MAX_CONNECTIONS', 2000))
+    ASYNC_FLASK_THREADS = int(os.getenv('ASYNC_FLASK_THREADS', 32))
+
+    # On-disk audio segment cache (byte ranges of recently played tracks, LRU evicted)
+    SEGMENT_CACHE_MAX_BYTES = int(os.getenv('SEGMENT_CACHE_MAX_MB', 2048)) * 1024 * 1024
+    SEGMENT_CACHE_SEGMENT_SIZE = int(os.getenv('SEGMENT_CACHE_SEGMENT_KB', 256)) * 1024
+
+    # Background pre-resolution of the next tracks in radio/flow/recommendation queues.
+    # PREFETCH_KB > 0 also pulls that many leading bytes of each into the segment cache.
+    PREFETCH_TRACKS = int(os.getenv('PREFETCH_TRACKS', 3))
+    PREFETCH_WORKERS = int(os.getenv('PREFETCH_WORKERS', 2))
+    PREFETCH_BYTES = int(os.getenv('PREFETCH_KB', 0)) * 1024
+
+    # Coalesce resolutions of the same video across workers too (flock in CACHE_FOLDER/locks)
+    RESOLVER_CROSS_WORKER = os.getenv('RESOLVER_CROSS_WORKER', '1') == '1'
+    RESOLVER_LOCK_WAIT = float(os.getenv('RESOLVER_LOCK_WAIT', 20))
+
+    # Piped instance directory: refreshed in the background, never on the request path.
+    # Each worker checks every PIPED_REFRESH_CHECK seconds, one of them fetches when stale.
+    PIPED_REFRESH_INTERVAL = int(os.getenv('PIPED_REFRESH_INTERVAL', 3600))
+    PIPED_REFRESH_CHECK = int(os.getenv('PIPED_REFRESH_CHECK', 60))
+
+    # yt-dlp strategies run in a process pool with long-lived extractors
+    YTDLP_PROCESSES = int(os.getenv('YTDLP_PROCESSES', 2))
+    YTDLP_TIMEOUT = float(os.getenv('YTDLP_TIMEOUT', 20))
+    YTDLP_SOCKET_TIMEOUT = float(os.getenv('YTDLP_SOCKET_TIMEOUT', 10))
+    YTDLP_MAX_TASKS_PER_CHILD = int(os.getenv('YTDLP_MAX_TASKS_PER_CHILD', 100))
+
+    # Time budgets (seconds) for resolving a stream URL, per caller. Every upstream
+    # attempt gets at most what is left, attempts that no longer fit are skipped.
+    STREAM_RESOLVE_BUDGET = float(os.getenv('STREAM_RESOLVE_BUDGET', 15))
+    DEBUG_STREAM_BUDGET = float(os.getenv('DEBUG_STREAM_BUDGET', 90))
+    PREFETCH_RESOLVE_BUDGET = float(os.getenv('PREFETCH_RESOLVE_BUDGET', 30))
+
+    # How often one response may reconnect to upstream (Range from the next byte)
+    # after the upstream body drops partway, before the listener's stream is cut
+    STREAM_MAX_RECONNECTS = int(os.getenv('STREAM_MAX_RECONNECTS', 3))
+
+    # /api/proxy_image: covers are resized once, stored as WebP and served from disk
+    IMAGE_CACHE_MAX_BYTES = int(os.getenv('IMAGE_CACHE_MAX_MB', 512)) * 1024 * 1024
+    IMAGE_CACHE_TTL = int(os.getenv('IMAGE_CACHE_TTL', 7 * 86400))
+    IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_KB', 10240)) * 1024
+    IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', 80))
+
+    # YTMusic search results (search + suggestions): fresh for SEARCH_CACHE_TTL, then served
+    # stale for up to SEARCH_CACHE_STALE_TTL more while a background refresh runs
+    SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', 600))
+    SEARCH_CACHE_STALE_TTL = int(os.getenv('SEARCH_CACHE_STALE_TTL', 3600))
+    SEARCH_CACHE_ENTRIES = int(os.getenv('SEARCH_CACHE_ENTRIES', 5000))
+
+    # Local catalog in /api/search: hits merged in front of YTMusic's; with at least
+    # SEARCH_LOCAL_ENOUGH of them, YTMusic gets SEARCH_LOCAL_WAIT seconds before we answer without it
+    SEARCH_LOCAL_LIMIT = int(os.getenv('SEARCH_LOCAL_LIMIT', 10))
+    SEARCH_LOCAL_ENOUGH = int(os.getenv('SEARCH_LOCAL_ENOUGH', 5))
+    SEARCH_LOCAL_WAIT = float(os.getenv('SEARCH_LOCAL_WAIT', 0.3))
+
+    # Suggestions: in-memory prefix index per worker, YTMusic only below SUGGEST_MIN_LOCAL matches
+    SUGGEST_INDEX_MAX = int(os.getenv('SUGGEST_INDEX_MAX', 50000))
+    SUGGEST_MIN_LOCAL = int(os.getenv('SUGGEST_MIN_LOCAL', 5))
+    SUGGEST_MIN_QUERY_COUNT = int(os.getenv('SUGGEST_MIN_QUERY_COUNT', 3))  # Searches before a raw query is suggested
+
+    # Radio queues by seed video_id (recommendations, flow, radio)
+    WATCH_CACHE_TTL = int(os.getenv('WATCH_CACHE_TTL', 3600))
+    WATCH_CACHE_STALE_TTL = int(os.getenv('WATCH_CACHE_STALE_TTL', 6 * 3600))
+
+    # Local co-occurrence recommender (likes, plays, playlists). Each worker rebuilds from the
+    # database every RECOMMENDER_REBUILD_INTERVAL seconds; users with fewer than
+    # RECOMMENDER_MIN_RESULTS recommendations fall back to YTMusic radio.
+    RECOMMENDER_REBUILD_INTERVAL = int(os.getenv('RECOMMENDER_REBUILD_INTERVAL', 600))
+    RECOMMENDER_MAX_BASKET = int(os.getenv('RECOMMENDER_MAX_BASKET', 200))
+    RECOMMENDER_MIN_RESULTS = int(os.getenv('RECOMMENDER_MIN_RESULTS', 10))
+
+    # Podcast episode lists: page size, longest list fetched, freshness like the search cache
+    PODCAST_PAGE_SIZE = int(os.getenv('PODCAST_PAGE_SIZE', 50))
+    PODCAST_MAX_EPISODES = int(os.getenv('PODCAST_MAX_EPISODES', 1600))
+    PODCAST_CACHE_TTL = int(os.getenv('PODCAST_CACHE_TTL', 3600))
+    PODCAST_CACHE_STALE_TTL = int(os.getenv('PODCAST_CACHE_STALE_TTL', 12 * 3600))
+
+    # /api/flow sessions: page size, lifetime, radio fetches per page and dedupe memory
+    FLOW_PAGE_SIZE = int(os.getenv('FLOW_PAGE_SIZE', 25))
+    FLOW_SESSION_TTL = int(os.getenv('FLOW_SESSION_TTL', 6 * 3600))
+    FLOW_MAX_FETCHES = int(os.getenv('FLOW_MAX_FETCHES', 4))
+    FLOW_MAX_HEARD = int(os.getenv('FLOW_MAX_HEARD', 2000))
+
+    # Uploads: background workers for tags/duration and the loudness-normalized AAC rendition (ffmpeg)
+    UPLOAD_WORKERS = int(os.getenv('UPLOAD_WORKERS', 2))
+    UPLOAD_RENDITION_BITRATE = os.getenv('UPLOAD_RENDITION_BITRATE', '128k')
+    UPLOAD_PROCESS_TIMEOUT = int(os.getenv('UPLOAD_PROCESS_TIMEOUT', 300))
+
+    # Precomputed feed/discover/podcasts responses: rebuilt in the background every
+    # SNAPSHOT_INTERVAL seconds, clients may reuse them for SNAPSHOT_MAX_AGE
+    SNAPSHOT_INTERVAL = int(os.getenv('SNAPSHOT_INTERVAL', 1800))
+    SNAPSHOT_CHECK = int(os.getenv('SNAPSHOT_CHECK', 60))
+    SNAPSHOT_MAX_AGE = int(os.getenv('SNAPSHOT_MAX_AGE', 300))
+
+    # Lyrics cache: found lyrics rarely change, misses are retried after a day
+    LYRICS_TTL = int(os.getenv('LYRICS_TTL', 30 * 86400))
+    LYRICS_MISS_TTL = int(os.getenv('LYRICS_MISS_TTL', 86400))
+
+    # Bearer token required by /api/metrics, open when unset
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN')
@@ -0,0 +1,133 @@
+import io
+import os
+import hashlib
+import tempfile
+
+from PIL import Image
+
+from server.config import Config
+from server.cache import SharedCache, SingleFlight, DiskLRU, atomic_write
+from server.upstream import http_get
+
+# Requested sizes snap up to one of these (longest side, px), so a URL has a handful of variants at most
+IMAGE_SIZES = (64, 128, 256, 512, 1024)
+
+# Use a standard browser User-Agent
+IMAGE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+class ImageTooLarge(Exception):
+    """The origin image is over Config.IMAGE_MAX_BYTES."""
+
+class ImageUpstreamError(Exception):
+    """The origin answered with something other than 200."""
+
+    def __init__(self, status):
+        super().__init__(f'Upstream error {status}')
+        self.status = status
+
+
+class ImageCache:
+    """
+    Content-addressed cache of resized covers.
+    Blobs live in <folder>/<sha1 of the bytes>.<ext>, so the hash doubles as a strong ETag and
+    identical covers behind different URLs are stored once. A SharedCache index maps
+    (url, size) to the blob. Reads bump blob mtimes, eviction drops the least recently used.
+    """
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        os.makedirs(folder, exist_ok=True)
+        self.index = SharedCache('image_index', max_entries=16384)
+        self._fetches = SingleFlight()
+        self._lru = DiskLRU(folder, max_bytes, 'ImageCache')
+
+    @staticmethod
+    def snap_size(size):
+        """Closest allowed size at or above `size` (the largest for None or anything bigger)."""
+        for allowed in IMAGE_SIZES:
+            if size is not None and size <= allowed:
+                return allowed
+        return IMAGE_SIZES[-1]
+
+    def path(self, entry):
+        return os.path.join(self.folder, f"{entry['hash']}.{entry['ext']}")
+
+    def get(self, url, size):
+        """Index entry {'hash', 'ext', 'mimetype'} for url at size, fetching and resizing on a miss."""
+        key = f"{size}:{url}"
+        entry = self.index.get(key)
+        if entry and os.path.exists(self.path(entry)):
+            try: os.utime(self.path(entry))  # LRU
+            except OSError: pass
+            return entry
+        return self._fetches.do(key, lambda: self._fetch(key, url, size))
+
+    def _fetch(self, key, url, size):
+        with tempfile.TemporaryFile(dir=self.folder) as original:
+            mimetype = self._download(url, original)
+            original.seek(0)
+            data, ext, mimetype = self._resize(original, size, mimetype)
+
+        digest = hashlib.sha1(data).hexdigest()
+        entry = {'hash': digest, 'ext': ext, 'mimetype': mimetype}
+        path = self.path(entry)
+        if not os.path.exists(path):
+            self._write(path, data)
+        self.index.set(key, entry, Config.IMAGE_CACHE_TTL)
+        return entry
+
+    def _download(self, url, out):
+        """Stream the origin body into `out`, at most IMAGE_MAX_BYTES. Returns its Content-Type."""
+        resp = http_get(url, headers=IMAGE_HEADERS, stream=True, timeout=10, verify=False)
+        try:
+            if resp.status_code != 200:
+                raise ImageUpstreamError(resp.status_code)
+            length = resp.headers.get('Content-Length', '')
+            if length.isdigit() and int(length) > Config.IMAGE_MAX_BYTES:
+                raise ImageTooLarge(f'Image is {length} bytes')
+            received = 0
+            for chunk in resp.iter_content(chunk_size=65536):
+                received += len(chunk)
+                if received > Config.IMAGE_MAX_BYTES:
+                    raise ImageTooLarge(f'Image is over {Config.IMAGE_MAX_BYTES} bytes')
+                out.write(chunk)
+            return resp.headers.get('Content-Type', 'application/octet-stream')
+        finally:
+            resp.close()
+
+    def _resize(self, original, size, mimetype):
+        """(bytes, ext, mimetype) of the image scaled down to fit size x size as WebP; the original if Pillow can't read it."""
+        try:
+            img = Image.open(original)
+            img.thumbnail((size, size), Image.Resampling.LANCZOS)
+            if img.mode not in ('RGB', 'RGBA'):
+                img = img.convert('RGBA' if 'transparency' in img.info or img.mode in ('LA', 'PA') else 'RGB')
+            out = io.BytesIO()
+            img.save(out, 'WEBP', quality=Config.IMAGE_QUALITY, method=4)
+            return out.getvalue(), 'webp', 'image/webp'
+        except Exception as e:
+            # SVGs and the like: serve them as they came, still cached
+            print(f"[ImageCache] Serving unresized image ({e})")
+            original.seek(0)
+            return original.read(), 'bin', mimetype
+
+    def _write(self, path, data):
+        try:
+            atomic_write(path, data)
+        except OSError as e:
+            print(f"[ImageCache] Write failed for {path}: {e}")
+            return
+        self._lru.wrote(len(data))
+
+    def evict(self):
+        """Drop least recently used blobs until the cache is back under 90% of max_bytes."""
+        self._lru.evict()
+
+image_cache = ImageCache(
+    os.path.join(Config.CACHE_FOLDER, 'images'),
+    max_bytes=Config.IMAGE_CACHE_MAX_BYTES
+)
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import threading
+from urllib.parse import urlsplit
+
+from server.config import Config
+from server.cache import FileLock, atomic_write
+
+# name -> (type, help). Every metric we export is listed here.
+METRICS = {
+    'mewzy_resolve_attempts_total': ('counter', 'Stream URL resolution attempts by strategy, host and outcome'),
+    'mewzy_resolve_attempt_seconds': ('histogram', 'Duration of single resolution attempts by strategy and host'),
+    'mewzy_resolutions_total': ('counter', 'Stream URL lookups by result (cache, resolved, failed)'),
+    'mewzy_resolve_seconds': ('histogram', 'Time to resolve a stream URL that was not cached'),
+    'mewzy_stream_ttfb_seconds': ('histogram', 'Time from request to first audio byte by source'),
+    'mewzy_stream_bytes_total': ('counter', 'Audio bytes sent to listeners by source'),
+    'mewzy_upstream_bytes_total': ('counter', 'Audio bytes read from upstream by host'),
+    'mewzy_stream_reconnects_total': ('counter', 'Mid-stream upstream reconnects by host'),
+}
+
+# Seconds; wide enough for a cached segment read and a slow yt-dlp extraction alike
+BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+class Metrics:
+    """
+    Counters and histograms for this worker. Every few seconds the worker writes its totals
+    to CACHE_FOLDER/metrics/<pid>-<start>.json; render() sums the files of all workers.
+    Files of finished workers are folded into retired.json, so totals never go backwards
+    while the instance is up and the folder stays small.
+    """
+
+    def __init__(self, folder, flush_interval=5):
+        self.folder = folder
+        self.flush_interval = flush_interval
+        os.makedirs(folder, exist_ok=True)
+        self.path = os.path.join(folder, f"{os.getpid()}-{int(time.time())}.json")
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        self._last_flush = 0
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted(labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            key = self._key(name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+            due = self._flush_due()
+        if due: self.flush()
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            key = self._key(name, labels)
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+            hist[-2] += 1
+            hist[-1] += value
+            due = self._flush_due()
+        if due: self.flush()
+
+    def _flush_due(self):
+        # Caller holds self._lock, so only one of the threads that cross the interval flushes
+        now = time.monotonic()
+        if now - self._last_flush < self.flush_interval: return False
+        self._last_flush = now
+        return True
+
+    def flush(self):
+        with self._lock:
+            self._last_flush = time.monotonic()
+            data = _serialize(self._counters, self._histograms)
+        try:
+            atomic_write(self.path, json.dumps(data))
+        except OSError as e:
+            print(f"[Metrics] Flush failed: {e}")
+
+    def collect(self):
+        """Totals of every worker on the instance: (counters, histograms) keyed like ours."""
+        self.flush()
+        self.retire_dead_workers()
+        retired = _read(os.path.join(self.folder, RETIRED)) or {}
+        merged = set(retired.get('merged', []))
+        counters, histograms = {}, {}
+        for entry in os.scandir(self.folder):
+            if not entry.name.endswith('.json') or entry.name in merged: continue
+            _add(counters, histograms, _read(entry.path) or {})
+        return counters, histograms
+
+    def retire_dead_workers(self):
+        """
+        Fold the files of workers that are gone into RETIRED and remove them, so the folder
+        doesn't grow with every restart. One worker at a time; the others just skip.
+        """
+        dead = [entry for entry in os.scandir(self.folder) if entry.name.endswith('.json') and not _worker_alive(entry.name)]
+        if not dead: return
+        with FileLock('metrics:retire', timeout=0) as lock:
+            if not lock.acquired: return
+            retired_path = os.path.join(self.folder, RETIRED)
+            retired = _read(retired_path) or {}
+            # Names already folded in whose removal failed last time: never count them twice
+            merged = [name for name in retired.get('merged', []) if os.path.exists(os.path.join(self.folder, name))]
+            counters, histograms = {}, {}
+            _add(counters, histograms, retired)
+            for entry in dead:
+                if entry.name in merged: continue
+                data = _read(entry.path)
+                if data is None: continue
+                _add(counters, histograms, data)
+                merged.append(entry.name)
+            data = _serialize(counters, histograms)
+            data['merged'] = merged
+            try:
+                atomic_write(retired_path, json.dumps(data))
+            except OSError as e:
+                print(f"[Metrics] Could not retire dead workers: {e}")
+                return
+            for name in merged:
+                try: os.remove(os.path.join(self.folder, name))
+                except OSError: pass
+            print(f"[Metrics] Retired {len(merged)} finished worker file(s)")
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        counters, histograms = self.collect()
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+            else:
+                for (metric, labels), hist in sorted(histograms.items()):
+                    if metric != name: continue
+                    for bound, count in zip(BUCKETS, hist):
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {count}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {hist[-2]}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(hist[-1])}")
+                    lines.append(f"{name}_count{_labels(labels)} {hist[-2]}")
+        return '\n'.join(lines) + '\n'
+
+# Totals of finished workers, kept so counters never go backwards while the instance is up
+RETIRED = 'retired.json'
+
+def _worker_alive(name):
+    if name == RETIRED: return True
+    try:
+        pid = int(name.split('-', 1)[0])
+    except ValueError:
+        return True
+    if pid == os.getpid(): return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # Exists, just not ours to signal
+    return True
+
+def _read(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _serialize(counters, histograms):
+    return {
+        'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+        'histograms': [[name, list(labels), hist] for (name, labels), hist in histograms.items()]
+    }
+
+def _add(counters, histograms, data):
+    """Add a flushed file's totals into counters/histograms."""
+    for name, labels, value in data.get('counters', []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        counters[key] = counters.get(key, 0) + value
+    for name, labels, hist in data.get('histograms', []):
+        key = (name, tuple(tuple(pair) for pair in labels))
+        total = histograms.get(key)
+        histograms[key] = hist if total is None else [a + b for a, b in zip(total, hist)]
+
+def _labels(labels):
+    if not labels: return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def host_label(url):
+    """Upstream host for labels. googlevideo's rN---sn-xxx edge hosts collapse into one label."""
+    host = urlsplit(url).hostname or 'unknown'
+    return 'googlevideo.com' if host.endswith('.googlevideo.com') else host
+
+metrics = Metrics(os.path.join(Config.CACHE_FOLDER, 'metrics'))
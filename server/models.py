@@ -43,6 +43,15 @@ class Track(db.Model):
     genre = db.Column(db.String(100))
     category = db.Column(db.String(100))
     description = db.Column(db.Text)
+    # sha256 of an uploaded file, so the same bytes are stored once
+    content_hash = db.Column(db.String(64), unique=True, index=True)
+    # Id the upload's streaming rendition is served under, once it exists (see server/uploads.py)
+    rendition_id = db.Column(db.String(64))
+
+    @property
+    def stream_url(self):
+        # URLs handed out earlier keep pointing at the same bytes, only new listings get the rendition
+        return f"/api/stream/{self.rendition_id or self.video_id}"
 
 class Playlist(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,70 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from server.config import Config
+from server.upstream import Deadline
+from server.resolver import UpstreamAudio, UpstreamChanged, get_stream_url, stream_url_cache
+from server.segment_cache import segment_cache
+from server.uploads import find_local_track
+
+# Small on purpose: each job can itself fan out RESOLVER_MAX_PARALLEL attempts on the resolver pool
+prefetch_executor = ThreadPoolExecutor(max_workers=Config.PREFETCH_WORKERS, thread_name_prefix='prefetch')
+_queued = set()
+_queued_lock = threading.Lock()
+
+def prefetch_streams(tracks, limit=None):
+    """
+    Resolve the stream URLs of the first `limit` tracks of a queue in the background
+    (and, with PREFETCH_KB set, pull their first bytes into the segment cache),
+    so skipping to the next track starts without paying for resolution.
+    """
+    limit = Config.PREFETCH_TRACKS if limit is None else limit
+    for track in tracks[:limit]:
+        video_id = track.get('id')
+        # Uploaded tracks are on our disk already, YouTube can never resolve their ids
+        if not video_id or find_local_track(video_id) or stream_url_cache.get(video_id):
+            continue
+        with _queued_lock:
+            if video_id in _queued: continue
+            _queued.add(video_id)
+        prefetch_executor.submit(_prefetch_one, video_id)
+
+def _prefetch_one(video_id):
+    errors = []
+    try:
+        url, _ = get_stream_url(video_id, errors, deadline=Deadline(Config.PREFETCH_RESOLVE_BUDGET))
+        if not url:
+            print(f"[Prefetch] Could not resolve {video_id}")
+            return
+        if Config.PREFETCH_BYTES:
+            warm_first_bytes(video_id, errors, Config.PREFETCH_BYTES)
+    except Exception as e:
+        print(f"[Prefetch] {video_id} failed: {e}")
+    finally:
+        with _queued_lock:
+            _queued.discard(video_id)
+
+def warm_first_bytes(video_id, errors, nbytes):
+    upstream = UpstreamAudio(video_id, errors, budget=Config.PREFETCH_RESOLVE_BUDGET)
+    meta = segment_cache.meta(video_id)
+    if meta:
+        # Only the file the cached segments belong to (UpstreamChanged otherwise)
+        upstream.size, upstream.content_type = meta['size'], meta['content_type']
+    else:
+        # One byte is enough to learn the body size from Content-Range
+        probe = upstream.open(0, 0)
+        size = upstream.total_size(probe)
+        content_type = probe.headers.get('Content-Type', 'audio/mpeg')
+        probe.close()
+        if size is None: return
+        meta = segment_cache.save_meta(video_id, size, content_type)
+
+    end = min(nbytes, meta['size']) - 1
+    if segment_cache.covers(video_id, meta['size'], 0, end): return
+    fetch = lambda first, last: upstream.stream(first, last)
+    try:
+        for _ in segment_cache.read(video_id, 0, end, meta['size'], fetch):
+            pass
+    except UpstreamChanged as e:
+        print(f"[Prefetch] {video_id}: {e}, dropping its cached segments")
+        segment_cache.drop(video_id)
@@ -0,0 +1,208 @@
+import time
+import threading
+
+import numpy as np
+from scipy import sparse
+
+from server.config import Config
+
+# How much each kind of signal counts in a user's profile
+LIKE_WEIGHT = 2.0
+PLAY_WEIGHT = 1.0
+
+
+class CooccurrenceRecommender:
+    """
+    Item-to-item recommendations from our own data. Every user's likes, every user's recent plays
+    and every playlist is a "basket"; two tracks co-occur when they share one. Counts live in a
+    sparse track x track matrix, scores are one sparse mat-vec normalized by item popularity
+    (cosine), so a user with dozens of seeds over thousands of tracks takes a few milliseconds.
+
+    Built in full from the database (on first use, then every RECOMMENDER_REBUILD_INTERVAL in the
+    background so other workers' writes show up) and updated incrementally in between: add()/remove()
+    queue pair deltas that are folded into the matrix on the next read.
+    """
+
+    def __init__(self, max_basket=None):
+        self.max_basket = max_basket or Config.RECOMMENDER_MAX_BASKET
+        self._lock = threading.RLock()
+        self._reset()
+        self.built_at = 0
+        self._thread = None
+
+    def _reset(self):
+        self.index = {}          # Track.id -> row
+        self.track_ids = []      # row -> Track.id
+        self.baskets = {}        # 'likes:<uid>' / 'plays:<uid>' / 'playlist:<pid>' -> {row: None}, oldest first
+        self.counts = np.zeros(0)
+        self.matrix = sparse.csr_matrix((0, 0))
+        self.pending = {}        # (row, row) -> delta not yet in matrix
+
+    def _row(self, track_id):
+        row = self.index.get(track_id)
+        if row is None:
+            row = self.index[track_id] = len(self.track_ids)
+            self.track_ids.append(track_id)
+        return row
+
+    # --- building ---
+
+    def build(self):
+        """Rebuild everything from the database (needs an app context)."""
+        from server.models import db, user_likes, playlist_tracks, RecentlyPlayed
+        likes = db.session.execute(db.select(user_likes.c.user_id, user_likes.c.track_id)).all()
+        playlists = db.session.execute(db.select(playlist_tracks.c.playlist_id, playlist_tracks.c.track_id)).all()
+        plays = db.session.execute(
+            db.select(RecentlyPlayed.user_id, RecentlyPlayed.track_id).order_by(RecentlyPlayed.last_played)
+        ).all()
+
+        baskets = {}
+        for user_id, track_id in likes:
+            baskets.setdefault(f"likes:{user_id}", []).append(track_id)
+        for playlist_id, track_id in playlists:
+            baskets.setdefault(f"playlist:{playlist_id}", []).append(track_id)
+        for user_id, track_id in plays:
+            baskets.setdefault(f"plays:{user_id}", []).append(track_id)
+
+        with self._lock:
+            self._reset()
+            rows, cols = [], []
+            for key, track_ids in baskets.items():
+                members = {}
+                for track_id in track_ids[-self.max_basket:]:  # Newest plays/likes when over the cap
+                    members[self._row(track_id)] = None
+                self.baskets[key] = members
+                items = np.fromiter(members, dtype=np.int64)
+                # Every ordered pair inside the basket, vectorized
+                rows.append(np.repeat(items, len(items)))
+                cols.append(np.tile(items, len(items)))
+
+            n = len(self.track_ids)
+            if rows:
+                rows, cols = np.concatenate(rows), np.concatenate(cols)
+                matrix = sparse.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n)).tocsr()
+            else:
+                matrix = sparse.csr_matrix((n, n))
+            # The diagonal counts the baskets each track is in
+            self.counts = matrix.diagonal().copy()
+            matrix.setdiag(0)
+            matrix.eliminate_zeros()
+            self.matrix = matrix
+            self.built_at = time.time()
+        print(f"[Recommender] Built from {len(baskets)} baskets over {n} tracks ({self.matrix.nnz} pairs)")
+
+    def ensure_built(self, app):
+        """Build on first use, then keep rebuilding in a background thread."""
+        if self.built_at == 0:
+            with self._lock:
+                if self.built_at == 0:
+                    self.build()
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._rebuild_loop, args=(app,), name='recommender', daemon=True)
+                    self._thread.start()
+
+    def _rebuild_loop(self, app):
+        while True:
+            time.sleep(Config.RECOMMENDER_REBUILD_INTERVAL)
+            try:
+                with app.app_context():
+                    self.build()
+            except Exception as e:
+                print(f"[Recommender] Rebuild failed: {e}")
+
+    # --- incremental updates ---
+
+    def add(self, basket_key, track_id):
+        with self._lock:
+            if self.built_at == 0: return  # The first build will read it from the database
+            row = self._row(track_id)
+            members = self.baskets.setdefault(basket_key, {})
+            if row in members:
+                members[row] = members.pop(row)  # Most recent again, no new pairs
+                return
+            if len(members) >= self.max_basket:
+                self._drop(members, next(iter(members)))
+            for other in members:
+                self._bump(row, other, 1)
+            members[row] = None
+            self._bump_count(row, 1)
+
+    def remove(self, basket_key, track_id):
+        with self._lock:
+            members = self.baskets.get(basket_key)
+            row = self.index.get(track_id)
+            if members is None or row not in members: return
+            self._drop(members, row)
+
+    def remove_basket(self, basket_key):
+        with self._lock:
+            members = self.baskets.pop(basket_key, None) or {}
+            rows = list(members)
+            for i, row in enumerate(rows):
+                for other in rows[i + 1:]:
+                    self._bump(row, other, -1)
+                self._bump_count(row, -1)
+
+    def _drop(self, members, row):
+        del members[row]
+        for other in members:
+            self._bump(row, other, -1)
+        self._bump_count(row, -1)
+
+    def _bump(self, a, b, delta):
+        self.pending[(a, b)] = self.pending.get((a, b), 0) + delta
+        self.pending[(b, a)] = self.pending.get((b, a), 0) + delta
+
+    def _bump_count(self, row, delta):
+        if row >= len(self.counts):
+            self.counts = np.concatenate([self.counts, np.zeros(len(self.track_ids) - len(self.counts))])
+        self.counts[row] += delta
+
+    def _fold(self):
+        """Apply pending deltas (and new tracks) to the matrix."""
+        n = len(self.track_ids)
+        if len(self.counts) < n:
+            self.counts = np.concatenate([self.counts, np.zeros(n - len(self.counts))])
+        if not self.pending and self.matrix.shape[0] == n: return
+        matrix = self.matrix
+        if matrix.shape[0] != n:
+            matrix = matrix.copy()
+            matrix.resize((n, n))
+        if self.pending:
+            keys = np.array(list(self.pending), dtype=np.int64).reshape(-1, 2)
+            values = np.fromiter(self.pending.values(), dtype=float, count=len(self.pending))
+            matrix = matrix + sparse.coo_matrix((values, (keys[:, 0], keys[:, 1])), shape=(n, n)).tocsr()
+            matrix.eliminate_zeros()
+            self.pending = {}
+        self.matrix = matrix.tocsr()
+
+    # --- scoring ---
+
+    def recommend(self, user_id, limit):
+        """Track.ids for user_id, best first. Empty when we know nothing about the user (cold start)."""
+        with self._lock:
+            self._fold()
+            n = len(self.track_ids)
+            if n == 0: return []
+            profile = np.zeros(n)
+            for key, weight in ((f"plays:{user_id}", PLAY_WEIGHT), (f"likes:{user_id}", LIKE_WEIGHT)):
+                rows = list(self.baskets.get(key, {}))
+                if rows:
+                    profile[rows] = np.maximum(profile[rows], weight)
+            seeds = np.flatnonzero(profile)
+            if len(seeds) == 0: return []
+
+            # Cosine-normalized co-occurrence: popular tracks don't win just for being everywhere
+            norm = np.sqrt(np.maximum(self.counts, 1))
+            scores = self.matrix.dot(profile / norm) / norm
+            scores[seeds] = 0  # Recommend what they don't already have
+            candidates = np.flatnonzero(scores > 0)
+            if len(candidates) == 0: return []
+            if len(candidates) > limit:
+                candidates = candidates[np.argpartition(-scores[candidates], limit)[:limit]]
+            best = candidates[np.argsort(-scores[candidates], kind='stable')]
+            return [self.track_ids[row] for row in best]
+
+recommender = CooccurrenceRecommender()
@@ -0,0 +1,637 @@
+import os
+import re
+import json
+import time
+import threading
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+from server.config import Config
+from server.cache import SharedCache, SingleFlight, FileLock
+from server.upstream import scoreboard, http_get, http_post, Deadline, DeadlineExceeded
+from server.ytdlp_pool import extract_audio_url, VideoUnavailable
+from server.metrics import metrics, host_label
+
+# Resolved stream URLs, shared by every worker on the instance
+stream_url_cache = SharedCache('stream_urls', max_entries=4096)
+
+# One resolution per video_id at a time in this worker, concurrent requests share it
+resolutions = SingleFlight()
+
+# Strategy attempts run here so one request can race several upstreams at once
+executor = ThreadPoolExecutor(max_workers=Config.RESOLVER_POOL_SIZE, thread_name_prefix='resolver')
+
+COBALT_INSTANCES = [
+    "https://api.cobalt.tools/api/json",
+    "https://cobalt.kwiatekmiki.pl/api/json",
+    "https://cobalt.laccds.com/api/json",
+    "https://xp.nw.r.appspot.com/api/json",
+    "https://api.cobalt.cool/api/json",
+    "https://cobalt.tools/api/json",
+    "https://cobalt.synced.sh/api/json"
+]
+
+COBALT_HEADERS = {
+    'Accept': 'application/json',
+    'Content-Type': 'application/json',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+
+INVIDIOUS_INSTANCES = [
+    "https://inv.nadeko.net",
+    "https://invidious.privacyredirect.com",
+    "https://yewtu.be",
+    "https://invidious.f5.si",
+    "https://vid.puffyan.us",
+    "https://invidious.drgns.space"
+]
+
+# (strategy number, yt-dlp player_client, label)
+YTDLP_CLIENTS = [
+    (4, 'ios', 'iOS'),
+    (5, 'android', 'Android'),
+    (6, 'web', 'Web'),
+    (7, 'tv', 'TV')
+]
+
+class StrategyFailed(Exception):
+    """
+    An attempt completed without a usable URL. The message ends up in the error details.
+    host_fault says whether the host is to blame (blocked, rate limited, broken) rather than the
+    video (unavailable, private, no audio): only those count against it in the scoreboard.
+    """
+
+    def __init__(self, message, host_fault=False):
+        super().__init__(message)
+        self.host_fault = host_fault
+
+def status_failure(res):
+    """StrategyFailed for a non-200 answer. 5xx, 403 and 429 are the host's fault unless it names a video error."""
+    host_fault = res.status_code >= 500 or res.status_code in [403, 429]
+    if host_fault:
+        try:
+            body = res.json()
+            host_fault = not (isinstance(body, dict) and body.get('error'))
+        except ValueError:
+            pass
+    return StrategyFailed(f"{'blocked: ' if res.status_code in [403, 429, 503] else ''}Status {res.status_code}", host_fault=host_fault)
+
+class StreamUnavailable(Exception):
+    """No playable upstream for a video (every strategy failed, or upstream refused the URL)."""
+
+class UpstreamChanged(StreamUnavailable):
+    """Upstream now serves another file for the video (size or format differ from what we had)."""
+
+def get_proxy_headers():
+    return {
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+        'Accept-Language': 'en-US,en;q=0.5',
+        'Referer': 'https://www.google.com/'
+    }
+
+# Hardcoded robust list found online (Piped instances)
+# Filtered out dead/DNS-failing instances from previous debug logs
+PIPED_FALLBACK_INSTANCES = [
+    "https://piped.video",
+    "https://piped.mha.fi",
+    "https://piped.smnz.de",
+    "https://piped.kavin.rocks",
+    "https://piped.projectsegfau.lt",
+    "https://piped.r4fo.com",
+    "https://piped.lunar.icu",
+    "https://piped.privacy.com.de",
+    "https://piped.tokhmi.xyz",
+    "https://piped.adminforge.de",
+    "https://piped.hostux.net",
+    "https://piped.chamuditha.com"
+]
+
+# Healthy instances from the directory, persisted by the background refresher for every worker
+PIPED_INSTANCES_FILE = os.path.join(Config.CACHE_FOLDER, 'piped_instances.json')
+_piped_state = {'mtime': None, 'fetched_at': 0, 'instances': []}  # Last read of the file in this worker
+_piped_refresher = None
+_piped_refresher_lock = threading.Lock()
+
+def get_healthy_piped_instances():
+    """
+    Piped API hosts, best first. Never touches the network: reads the list the refresher
+    persisted (re-read only when the file changes), the built-in list until there is one.
+    """
+    start_piped_refresher()
+    _, instances = _load_piped_instances()
+    return instances or PIPED_FALLBACK_INSTANCES
+
+def _load_piped_instances():
+    try:
+        mtime = os.stat(PIPED_INSTANCES_FILE).st_mtime
+    except OSError:
+        return 0, []
+    if mtime != _piped_state['mtime']:
+        try:
+            with open(PIPED_INSTANCES_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            _piped_state.update(mtime=mtime, fetched_at=data['fetched_at'], instances=data['instances'])
+        except (OSError, ValueError, KeyError):
+            pass  # Half-replaced or corrupt, keep what we had
+    return _piped_state['fetched_at'], _piped_state['instances']
+
+def fetch_piped_instances():
+    res = http_get("https://piped-instances.kavin.rocks/", timeout=5, verify=False)
+    if res.status_code != 200:
+        raise IOError(f"Instance directory answered {res.status_code}")
+    instances = res.json()
+    # Filter: up-to-date, healthy, and has https
+    healthy = [
+        i['api_url'] for i in instances
+        if i.get('api_url') and i.get('uptime_24h', 0) > 90 and 'https' in i['api_url']
+    ]
+    # Prioritize official/known fast ones if in the list
+    priority = ["https://piped.video", "https://piped.mha.fi"]
+    sorted_instances = [h for h in healthy if h in priority] + [h for h in healthy if h not in priority]
+
+    # Combine with fallback to ensure we have a good list
+    final_list = sorted_instances + [f for f in PIPED_FALLBACK_INSTANCES if f not in sorted_instances]
+    return final_list[:15] # Keep top 15
+
+def refresh_piped_instances(force=False):
+    """
+    Fetch the directory and persist the list if it is older than PIPED_REFRESH_INTERVAL.
+    One worker does it at a time, the others skip. True if a new list was written.
+    """
+    with FileLock('piped_instances', timeout=0) as lock:
+        if not lock.acquired:
+            return False
+        fetched_at, _ = _load_piped_instances()
+        if not force and time.time() - fetched_at < Config.PIPED_REFRESH_INTERVAL:
+            return False
+
+        print("[Player] Fetching fresh Piped instances...")
+        instances = fetch_piped_instances()
+        tmp_path = f"{PIPED_INSTANCES_FILE}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fetched_at': time.time(), 'instances': instances}, f)
+        os.replace(tmp_path, PIPED_INSTANCES_FILE)
+        return True
+
+def _piped_refresh_loop():
+    while True:
+        try:
+            refresh_piped_instances()
+        except Exception as e:
+            print(f"[Player] Failed to fetch Piped instances: {e}")
+        time.sleep(Config.PIPED_REFRESH_CHECK)
+
+def start_piped_refresher():
+    """Start this worker's refresher thread (once). Called lazily so importing stays side-effect free."""
+    global _piped_refresher
+    if _piped_refresher is not None: return
+    with _piped_refresher_lock:
+        if _piped_refresher is None:
+            _piped_refresher = threading.Thread(target=_piped_refresh_loop, name='piped-refresher', daemon=True)
+            _piped_refresher.start()
+
+# --- Strategy attempts (one upstream each) ---
+
+def try_cobalt(cob_host, video_id, cancel, deadline):
+    # Payload A: Strict/New (v10/v7)
+    payload_a = {
+        'url': f'https://www.youtube.com/watch?v={video_id}',
+        'vCodec': 'h264',
+        'vQuality': '720',
+        'aFormat': 'mp3',
+        'isAudioOnly': True
+    }
+    # Payload B: Legacy/Simple
+    payload_b = {
+        'url': f'https://www.youtube.com/watch?v={video_id}',
+        'downloadMode': 'audio'
+    }
+
+    print(f"Strategy 1 (Cobalt {cob_host}): Requesting Payload A...")
+    res = http_post(cob_host, json=payload_a, headers=COBALT_HEADERS, timeout=deadline.timeout(5), verify=False)
+    if res.status_code == 200:
+        data = res.json()
+        if 'url' in data:
+            print(f"Strategy 1 Success: Found URL via {cob_host} (Payload A)")
+            return data['url']
+
+    # If Payload A fails (e.g. 400 Bad Request), Try Payload B
+    if res.status_code == 400 or res.status_code == 500:
+        if cancel.is_set(): return None
+        print(f"Strategy 1 (Cobalt {cob_host}): Requesting Payload B (Fallback)...")
+        res = http_post(cob_host, json=payload_b, headers=COBALT_HEADERS, timeout=deadline.timeout(5), verify=False)
+        if res.status_code == 200:
+            data = res.json()
+            if 'url' in data:
+                print(f"Strategy 1 Success: Found URL via {cob_host} (Payload B)")
+                return data['url']
+        # Cobalt answers 400/500 for videos it can't fetch, that says nothing about the instance
+        raise StrategyFailed(f"Payload A/B failed ({res.status_code})", host_fault=res.status_code not in [200, 400, 500])
+
+    if res.status_code == 200:
+        raise StrategyFailed("No URL in response")
+    raise status_failure(res)
+
+def try_piped(host, video_id, cancel, deadline):
+    print(f"Strategy 2 (Piped): Trying {host}...")
+    res = http_get(f"{host}/streams/{video_id}", headers=get_proxy_headers(), timeout=deadline.timeout(5), verify=False)
+
+    # Cloudflare check
+    if res.status_code == 200:
+        if res.text.strip().startswith('<'): # HTML detected
+            print(f"Strategy 2 ({host}) blocked by Cloudflare (HTML response).")
+            raise StrategyFailed("blocked: Cloudflare HTML", host_fault=True)
+
+        data = res.json()
+        audio_streams = [s for s in data.get('audioStreams', []) if s.get('mimeType') and ('audio/mpeg' in s['mimeType'] or 'mp4' in s['mimeType'])]
+        if audio_streams:
+            audio_streams.sort(key=lambda x: x.get('bitrate', 0), reverse=True)
+            print(f"Strategy 2 Success: Found URL via {host}")
+            return audio_streams[0]['url']
+        raise StrategyFailed("No audio streams found")
+
+    if res.status_code in [403, 503, 429]:
+        print(f"Strategy 2 ({host}) blocked: {res.status_code}")
+    raise status_failure(res)
+
+def try_invidious(host, video_id, cancel, deadline):
+    print(f"Strategy 3 (Invidious): Trying {host}...")
+    res = http_get(f"{host}/api/v1/videos/{video_id}", headers=get_proxy_headers(), timeout=deadline.timeout(5), verify=False)
+    if res.status_code != 200:
+        raise status_failure(res)
+
+    data = res.json()
+    if 'formatStreams' not in data:
+        raise StrategyFailed("No streams found")
+
+    audio_streams = [s for s in data['formatStreams'] if 'audio' in s.get('type', '')]
+    if not audio_streams and 'adaptiveFormats' in data:
+        audio_streams = [s for s in data['adaptiveFormats'] if 'audio' in s.get('type', '')]
+    if not audio_streams:
+        raise StrategyFailed("No audio streams found")
+
+    print(f"Strategy 3 Success: Found URL via {host}")
+    return audio_streams[0]['url']
+
+def try_ytdlp(player_client, video_id, cancel, deadline):
+    try:
+        url = extract_audio_url(player_client, video_id, timeout=deadline.timeout(Config.YTDLP_TIMEOUT), cancel=cancel)
+    except VideoUnavailable as e:
+        raise StrategyFailed(str(e))
+    if cancel.is_set(): return None
+    if not url:
+        raise StrategyFailed("No URL in extracted info")
+    return url
+
+def build_candidates(video_id):
+    """
+    All attempts as (label, host, callable(cancel, deadline)). Strategy tiers keep their historical
+    order; inside a tier hosts are ranked by the scoreboard and open circuits are left out.
+    """
+    candidates = []
+    for cob_host in scoreboard.rank(COBALT_INSTANCES):
+        candidates.append((f"Strategy 1 ({cob_host})", cob_host, partial(try_cobalt, cob_host, video_id)))
+    for host in scoreboard.rank(get_healthy_piped_instances()):
+        candidates.append((f"Strategy 2 ({host})", host, partial(try_piped, host, video_id)))
+    for host in scoreboard.rank(INVIDIOUS_INSTANCES):
+        candidates.append((f"Strategy 3 ({host})", host, partial(try_invidious, host, video_id)))
+
+    clients = {f"yt-dlp:{c[1]}": c for c in YTDLP_CLIENTS}
+    for key in scoreboard.rank(list(clients)):
+        number, player_client, name = clients[key]
+        candidates.append((f"Strategy {number} ({name})", key, partial(try_ytdlp, player_client, video_id)))
+    return candidates
+
+def strategy_of(host):
+    """Strategy name of a scoreboard host key, for metrics labels."""
+    if host.startswith('yt-dlp:'): return 'yt-dlp'
+    if host in COBALT_INSTANCES: return 'cobalt'
+    if host in INVIDIOUS_INSTANCES: return 'invidious'
+    return 'piped'
+
+def run_scored(host, attempt, cancel, deadline):
+    """
+    Run one attempt and feed its outcome and latency into the scoreboard and metrics.
+    Transport errors, timeouts and StrategyFailed(host_fault=True) count against the host;
+    failures caused by the video don't, so requests for bad ids can't open every circuit.
+    """
+    started = time.monotonic()
+    outcome = 'failed'
+    try:
+        url = attempt(cancel, deadline)
+    except Exception as e:
+        if deadline.expired():
+            outcome = 'deadline'
+            scoreboard.release(host)  # We cut its timeout short, not the host's fault
+        elif isinstance(e, StrategyFailed) and not e.host_fault:
+            outcome = 'unavailable'
+            scoreboard.release(host)  # The video's fault, says nothing about the host
+        else:
+            scoreboard.record(host, False, time.monotonic() - started)
+        raise
+    else:
+        if url:
+            outcome = 'ok'
+            scoreboard.record(host, True, time.monotonic() - started)
+        elif cancel.is_set():
+            outcome = 'cancelled'
+            scoreboard.release(host)  # Lost the race, says nothing about the host
+        else:
+            scoreboard.record(host, False, time.monotonic() - started)
+        return url
+    finally:
+        labels = {'strategy': strategy_of(host), 'host': host if host.startswith('yt-dlp:') else host_label(host)}
+        metrics.inc('mewzy_resolve_attempts_total', outcome=outcome, **labels)
+        metrics.observe('mewzy_resolve_attempt_seconds', time.monotonic() - started, **labels)
+
+def hedged_race(candidates, errors, deadline=None, max_parallel=None, hedge_delay=None):
+    """
+    Run candidates concurrently in priority order and return the first URL any of them finds.
+    A new candidate starts when one fails, or after `hedge_delay` seconds without an answer,
+    with at most `max_parallel` in flight. Losers are cancelled (queued ones never start,
+    running ones see the cancel event and skip their remaining upstream calls).
+    Gives up with None once `deadline` runs out.
+    """
+    deadline = deadline or Deadline(None)
+    max_parallel = max_parallel or Config.RESOLVER_MAX_PARALLEL
+    hedge_delay = Config.RESOLVER_HEDGE_DELAY if hedge_delay is None else hedge_delay
+
+    cancel = threading.Event()
+    queue = list(candidates)
+    in_flight = {}  # future -> label
+    next_launch = time.monotonic()
+    started = time.monotonic()
+
+    try:
+        while queue or in_flight:
+            if deadline.expired():
+                errors.append(f"Deadline exceeded after {time.monotonic() - started:.1f}s ({len(queue)} attempts skipped)")
+                return None
+
+            # Launch as many as the hedge schedule allows
+            while queue and len(in_flight) < max_parallel and (not in_flight or time.monotonic() >= next_launch):
+                label, host, attempt = queue.pop(0)
+                if not scoreboard.allow(host):
+                    errors.append(f"{label}: Skipped (circuit open)")
+                    continue
+                in_flight[executor.submit(run_scored, host, attempt, cancel, deadline)] = label
+                next_launch = time.monotonic() + hedge_delay
+
+            timeout = None
+            if queue and len(in_flight) < max_parallel:
+                timeout = max(0, next_launch - time.monotonic())
+            remaining = deadline.remaining()
+            if remaining is not None:
+                timeout = remaining if timeout is None else min(timeout, remaining)
+
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                label = in_flight.pop(future)
+                try:
+                    url = future.result()
+                except StrategyFailed as e:
+                    errors.append(f"{label}: {e}")
+                except DeadlineExceeded:
+                    errors.append(f"{label}: Skipped (deadline)")
+                except Exception as e:
+                    print(f"{label} failed: {e}")
+                    errors.append(f"{label} Exception: {str(e)}")
+                else:
+                    if url:
+                        print(f"[Resolver] {label} won after {time.monotonic() - started:.2f}s")
+                        return url
+                    errors.append(f"{label}: No URL returned")
+                # A failure frees its slot straight away, no need to wait for the hedge delay
+                next_launch = time.monotonic()
+        return None
+    finally:
+        cancel.set()
+        for future in in_flight:
+            future.cancel()
+
+def stream_url_ttl(url):
+    """Seconds a resolved URL can be reused, read from its googlevideo `expire` param when present."""
+    match = re.search(r'[?&/]expire[=/](\d+)', url)
+    if not match:
+        return Config.STREAM_URL_DEFAULT_TTL
+    ttl = int(match.group(1)) - time.time() - Config.STREAM_URL_EXPIRY_MARGIN
+    return max(0, min(ttl, Config.STREAM_URL_MAX_TTL))
+
+def resolve_stream_url(video_id, errors, deadline=None):
+    """Race every strategy for video_id within the deadline, returns the audio URL or None."""
+    return hedged_race(build_candidates(video_id), errors, deadline=deadline)
+
+def get_stream_url(video_id, errors, refresh=False, deadline=None):
+    """
+    Cached, coalesced resolution. Returns (url, from_cache).
+    Pass refresh=True when upstream rejected the cached URL.
+    """
+    if refresh:
+        stream_url_cache.delete(video_id)
+    else:
+        url = stream_url_cache.get(video_id)
+        if url:
+            metrics.inc('mewzy_resolutions_total', result='cache')
+            return url, True
+
+    deadline = deadline or Deadline(None)
+    started = time.monotonic()
+    try:
+        url, attempt_errors = resolutions.do(
+            video_id,
+            lambda: _resolve_and_cache(video_id, deadline),
+            timeout=deadline.remaining()
+        )
+    except TimeoutError:
+        errors.append("Deadline exceeded while waiting for a concurrent resolution")
+        metrics.inc('mewzy_resolutions_total', result='failed')
+        return None, False
+    errors.extend(attempt_errors)
+    metrics.inc('mewzy_resolutions_total', result='resolved' if url else 'failed')
+    if url:
+        metrics.observe('mewzy_resolve_seconds', time.monotonic() - started)
+    return url, False
+
+def _resolve_and_cache(video_id, deadline):
+    errors = []
+    if Config.RESOLVER_CROSS_WORKER:
+        # Another worker resolving the same video holds this lock: wait for its answer instead of racing it
+        lock_wait = Config.RESOLVER_LOCK_WAIT
+        if deadline.remaining() is not None:
+            lock_wait = min(lock_wait, deadline.remaining())
+        with FileLock(f"resolve:{video_id}", timeout=lock_wait) as lock:
+            if lock.waited:
+                url = stream_url_cache.get(video_id)
+                if url: return url, errors
+            url = resolve_stream_url(video_id, errors, deadline)
+    else:
+        url = resolve_stream_url(video_id, errors, deadline)
+
+    if url:
+        stream_url_cache.set(video_id, url, stream_url_ttl(url))
+    return url, errors
+
+# Browser impersonation for the audio request itself
+AUDIO_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': '*/*',
+    'Referer': 'https://www.youtube.com/'
+}
+
+def base_type(content_type):
+    """'audio/webm' for 'audio/webm; codecs="opus"'."""
+    return (content_type or '').split(';', 1)[0].strip().lower()
+
+class UpstreamAudio:
+    """
+    Range requests against the resolved audio URL of one video.
+    Resolves lazily (a fully cached body never needs a URL) and re-resolves once when
+    upstream rejects a cached URL. Each open() gets `budget` seconds for resolving.
+    """
+
+    def __init__(self, video_id, errors, budget=None):
+        self.video_id = video_id
+        self.errors = errors
+        self.budget = budget
+        self.url = None
+        self.from_cache = False
+        # Body size and type of the file behind self.url, once upstream told us (or the caller
+        # set them from the segment cache meta: then any other file is refused)
+        self.size = None
+        self.content_type = None
+
+    def _get(self, first, last):
+        headers = dict(AUDIO_HEADERS)
+        headers['Range'] = f"bytes={first}-{'' if last is None else last}"
+        return http_get(self.url, headers=headers, stream=True, timeout=10, verify=False)
+
+    def open(self, first=0, last=None):
+        deadline = Deadline(self.budget)
+        if not self.url:
+            self.url, self.from_cache = get_stream_url(self.video_id, self.errors, deadline=deadline)
+            if not self.url:
+                raise StreamUnavailable('All streaming strategies failed')
+
+        resp = self._get(first, last)
+
+        # A cached URL can be revoked before its expiry, resolve once more before giving up
+        if resp.status_code in [403, 410] and self.from_cache:
+            print(f"[Player] Cached URL for {self.video_id} rejected ({resp.status_code}), re-resolving...")
+            resp.close()
+            self.url, self.from_cache = get_stream_url(self.video_id, self.errors, refresh=True, deadline=deadline)
+            if not self.url:
+                raise StreamUnavailable('All streaming strategies failed')
+            resp = self._get(first, last)
+
+        if resp.status_code not in [200, 206]:
+            resp.close()
+            stream_url_cache.delete(self.video_id)
+            raise StreamUnavailable(f'Upstream Error ({resp.status_code})')
+        self._check_same_file(resp)
+        return resp
+
+    def _check_same_file(self, resp):
+        """Remember size/type of the first response, refuse later ones that differ."""
+        size = self.total_size(resp)
+        content_type = resp.headers.get('Content-Type', 'audio/mpeg')
+        if self.size is None:
+            self.size, self.content_type = size, content_type
+            return
+        if self.content_type is None:
+            self.content_type = content_type
+        if (size is not None and size != self.size) or base_type(content_type) != base_type(self.content_type):
+            resp.close()
+            stream_url_cache.delete(self.video_id)
+            raise UpstreamChanged(f'Upstream now serves a different file ({size} bytes of {content_type}, was {self.size} of {self.content_type})')
+
+    def resume(self, first, last=None, refresh=False):
+        """
+        Reopen the body at `first` after upstream dropped us. The current URL is tried again
+        unless it was rejected (or `refresh`), then a fresh resolution, which may come from
+        another strategy. Refuses to splice in a body of a different size.
+        """
+        resp = None
+        if self.url and not refresh:
+            resp = self._get(first, last)
+            if resp.status_code not in [200, 206]:
+                resp.close()
+                resp = None
+
+        if resp is None:
+            self.url, self.from_cache = get_stream_url(self.video_id, self.errors, refresh=True, deadline=Deadline(self.budget))
+            if not self.url:
+                raise StreamUnavailable('All streaming strategies failed')
+            resp = self._get(first, last)
+            if resp.status_code not in [200, 206]:
+                resp.close()
+                stream_url_cache.delete(self.video_id)
+                raise StreamUnavailable(f'Upstream Error ({resp.status_code})')
+
+        self._check_same_file(resp)
+        return resp
+
+    def stream(self, first, last=None, resp=None, chunk_size=65536):
+        """
+        Bytes first..last (inclusive, None = to the end) as one uninterrupted iterator,
+        starting from `resp` if the caller already opened it. When the upstream body breaks
+        off (reset, read timeout, URL expired mid-play) it resumes with a Range request from
+        the next byte, up to Config.STREAM_MAX_RECONNECTS times.
+        """
+        offset = first
+        reconnects = 0
+        try:
+            while True:
+                try:
+                    if resp is None:
+                        resp = self.resume(offset, last, refresh=reconnects > 1) if reconnects else self.open(offset, last)
+                    end = last if last is not None else (self.size - 1 if self.size is not None else None)
+                    host = host_label(self.url)
+                    for chunk in self.iter_from(resp, offset, chunk_size):
+                        offset += len(chunk)
+                        metrics.inc('mewzy_upstream_bytes_total', len(chunk), host=host)
+                        yield chunk
+                    resp = None
+                    if end is None or offset > end:
+                        return
+                    raise IOError(f"Upstream closed at byte {offset} of {end + 1}")
+                except OSError as e:  # requests errors, resets and read timeouts are all OSErrors
+                    if resp is not None:
+                        resp.close()
+                        resp = None
+                    if reconnects >= Config.STREAM_MAX_RECONNECTS:
+                        raise
+                    reconnects += 1
+                    metrics.inc('mewzy_stream_reconnects_total', host=host_label(self.url or ''))
+                    print(f"[Player] Upstream for {self.video_id} dropped at byte {offset} ({e}), reconnecting ({reconnects}/{Config.STREAM_MAX_RECONNECTS})...")
+        finally:
+            if resp is not None:
+                resp.close()
+
+    @staticmethod
+    def total_size(resp):
+        """Full body size from Content-Range (206) or Content-Length (200), None if upstream can't tell."""
+        content_range = resp.headers.get('Content-Range', '')
+        match = re.search(r'/(\d+)$', content_range)
+        if match:
+            return int(match.group(1))
+        if resp.status_code == 200 and resp.headers.get('Content-Length', '').isdigit():
+            return int(resp.headers['Content-Length'])
+        return None
+
+    @staticmethod
+    def iter_from(resp, first, chunk_size=65536):
+        """Body bytes starting at `first`, even if upstream ignored the Range header and sent everything."""
+        skip = first if resp.status_code == 200 else 0
+        try:
+            for chunk in resp.iter_content(chunk_size=chunk_size):
+                if skip:
+                    if len(chunk) <= skip:
+                        skip -= len(chunk)
+                        continue
+                    chunk = chunk[skip:]
+                    skip = 0
+                yield chunk
+        finally:
+            resp.close()
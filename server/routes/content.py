@@ -1,9 +1,18 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
+from sqlalchemy.exc import IntegrityError
 from server.models import db, User, Track, RecentlyPlayed
 from server.utils import optional_get_identity
 from server.config import Config
+from server.prefetch import prefetch_streams
+from server.cache import SharedCache, SWRCache, FileLock
+from server.suggest import suggestion_index, seed_from_tracks
+from server.snapshots import snapshots
+from server.recommender import recommender
+from server.track_search import search_tracks
+from server.uploads import store_upload, submit_processing, find_local_track
 from ytmusicapi import YTMusic
 import random
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 import os
 import uuid
 
@@ -11,6 +20,47 @@ content_bp = Blueprint('content', __name__)
 yt = YTMusic()
 ALLOWED_EXTENSIONS = {'mp3', 'wav', 'ogg', 'm4a'}
 
+# Raw yt.search results for every worker, keyed on the normalized (query, filter, limit)
+search_cache = SWRCache('search', Config.SEARCH_CACHE_TTL, Config.SEARCH_CACHE_STALE_TTL, max_entries=Config.SEARCH_CACHE_ENTRIES)
+
+def cached_search(query, yt_filter, limit):
+    """yt.search through search_cache. Case and extra whitespace don't make a new entry."""
+    normalized = ' '.join(query.lower().split())
+    key = f"{yt_filter}:{limit}:{normalized}"
+    return search_cache.get(key, lambda: yt.search(normalized, filter=yt_filter, limit=limit))
+
+# Radio queues (watch playlists) by seed video_id, formatted, for every worker
+watch_cache = SWRCache('watch_playlists', Config.WATCH_CACHE_TTL, Config.WATCH_CACHE_STALE_TTL, max_entries=4096)
+WATCH_LIMIT = 25  # Fetched once per seed, callers take what they need
+radio_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='radio')
+
+def format_watch_tracks(radio):
+    return [{
+        'id': t['videoId'],
+        'title': t['title'],
+        'artist': t['artists'][0]['name'] if 'artists' in t else 'Unknown',
+        'cover': t.get('thumbnails', t.get('thumbnail', [{'url':''}]))[-1]['url'],
+        'duration': '0:00',
+        'stream_url': f"/api/stream/{t['videoId']}"
+    } for t in radio.get('tracks', []) if 'videoId' in t]
+
+def get_watch_tracks(video_id, limit):
+    """Radio queue for one seed, through watch_cache."""
+    tracks = watch_cache.get(video_id, lambda: format_watch_tracks(yt.get_watch_playlist(videoId=video_id, limit=WATCH_LIMIT)))
+    return tracks[:limit]
+
+def get_watch_tracks_many(seed_ids, limit):
+    """Radio queues for several seeds at once (one round trip for the misses). Failed seeds get []."""
+    futures = {seed: radio_executor.submit(get_watch_tracks, seed, limit) for seed in seed_ids}
+    queues = {}
+    for seed, future in futures.items():
+        try:
+            queues[seed] = future.result()
+        except Exception as e:
+            print(f"Radio fetch error for {seed}: {e}")
+            queues[seed] = []
+    return queues
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -25,23 +75,64 @@ def upload_file():
     
     if file and allowed_file(file.filename):
         ext = file.filename.rsplit('.', 1)[1].lower()
-        vid = str(uuid.uuid4())
-        filename = f"{vid}.{ext}"
-        save_path = os.path.join(Config.UPLOAD_FOLDER, filename)
-        file.save(save_path)
-
-        # metadata
-        title = request.form.get('title', filename)
-        artist = request.form.get('artist', 'Unknown Artist')
+        vid, save_path, content_hash = store_upload(file, ext)
+
+        # Same bytes uploaded before: keep the one copy
+        existing = Track.query.filter_by(content_hash=content_hash).first()
+        if existing:
+            return reuse_upload(existing, save_path, ext)
+
+        # metadata (what the uploader leaves out comes from the file's tags, see process_upload)
+        fill = [field for field in ('title', 'artist') if not request.form.get(field)] + ['genre']
+        title = request.form.get('title') or file.filename.rsplit('.', 1)[0]
+        artist = request.form.get('artist') or 'Unknown Artist'
         cover = request.form.get('cover', '')
 
-        track = Track(video_id=vid, title=title, artist=artist, cover_url=cover, duration=request.form.get('duration','0:00'))
+        track = Track(video_id=vid, title=title, artist=artist, cover_url=cover, duration=request.form.get('duration','0:00'), content_hash=content_hash)
         db.session.add(track)
-        db.session.commit()
-        return jsonify({'message': 'Uploaded', 'id': vid, 'url': f"/api/stream/{vid}"}), 201
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # The same file was uploaded concurrently and the other row won the unique content_hash
+            db.session.rollback()
+            existing = Track.query.filter_by(content_hash=content_hash).first()
+            if existing is None: raise
+            return reuse_upload(existing, save_path, ext)
+        suggestion_index.add(title)
+        submit_processing(current_app._get_current_object(), track.id, save_path, fill)
+        return jsonify({'message': 'Uploaded', 'id': vid, 'url': track.stream_url}), 201
         
     return jsonify({'error': 'Invalid file type'}), 400
 
+def reuse_upload(existing, save_path, ext):
+    """Answer for bytes we already have: drop the new copy, or put it in place if the old file went missing."""
+    if find_local_track(existing.video_id):
+        os.remove(save_path)
+    else:
+        os.replace(save_path, os.path.join(Config.UPLOAD_FOLDER, f"{existing.video_id}.{ext}"))
+    return jsonify({'message': 'Already uploaded', 'id': existing.video_id, 'url': existing.stream_url}), 200
+
+search_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='search')
+
+def local_search(query):
+    """Formatted hits from the full-text index over Track, [] if it fails."""
+    try:
+        tracks = search_tracks(query, Config.SEARCH_LOCAL_LIMIT)
+    except Exception as e:
+        print(f"Local Search Error: {e}")
+        db.session.rollback()
+        return []
+    return [{
+        'id': t.video_id,
+        'title': t.title,
+        'artist': t.artist or 'Unknown',
+        'cover': t.cover_url or '',
+        'duration': t.duration or '0:00',
+        'stream_url': t.stream_url,
+        'type': 'songs',
+        'item_count': None
+    } for t in tracks]
+
 @content_bp.route('/search', methods=['GET'])
 def search():
     query = request.args.get('q')
@@ -53,7 +144,25 @@ def search():
         elif search_type == 'episodes': yt_filter = 'episodes'
         elif search_type == 'playlists': yt_filter = 'playlists'
 
-        results = yt.search(query, filter=yt_filter, limit=20)
+        # YTMusic in the background while the local catalog answers
+        upstream = search_executor.submit(cached_search, query, yt_filter, 20)
+        local = local_search(query) if search_type == 'songs' else []
+        try:
+            # Enough local hits: don't sit on the network, the fetch still fills the cache for next time
+            wait = Config.SEARCH_LOCAL_WAIT if len(local) >= Config.SEARCH_LOCAL_ENOUGH else None
+            results = upstream.result(timeout=wait)
+        except TimeoutError:
+            results = []
+        except Exception as e:
+            if not local: raise
+            print(f"Search Error (serving local hits): {e}")
+            results = []
+
+        if search_type == 'songs':
+            # Popular queries rank above titles we have only seen once (after a few searches, see add_query)
+            suggestion_index.add_query(query)
+            for r in results:
+                if r.get('title'): suggestion_index.add(r['title'])
         formatted = []
         for r in results:
             id_key = 'browseId' if search_type in ['podcasts', 'playlists'] else 'videoId'
@@ -73,6 +182,11 @@ def search():
                 'type': search_type,
                 'item_count': r.get('itemCount', 'Unknown') if search_type == 'playlists' else None
             })
+        if local:
+            # Our own catalog first, then YTMusic's ranking, no track twice
+            ids = {t['id'] for t in local}
+            formatted = local + [t for t in formatted if t['id'] not in ids]
+            formatted = formatted[:max(20, len(local))]
         return jsonify(formatted)
     except Exception as e:
         print(f"Search Error: {e}")
@@ -82,194 +196,307 @@ def search():
 def search_suggestions():
     q = request.args.get('q', '')
     if not q: return jsonify([])
+    # Answer from the local index while typing, ask YTMusic only when it knows too little
+    seed_from_tracks()
+    suggestions = suggestion_index.lookup(q, 8)
+    if len(suggestions) >= Config.SUGGEST_MIN_LOCAL:
+        return jsonify(suggestions)
     try:
-        results = yt.search(q, filter='songs', limit=8)
-        suggestions = []
+        results = cached_search(q, 'songs', 8)
         for r in results:
             title = r.get('title')
-            if title and title not in suggestions:
+            if not title: continue
+            suggestion_index.add(title)
+            if title not in suggestions and len(suggestions) < 8:
                 suggestions.append(title)
-            if len(suggestions) >= 8: break
         return jsonify(suggestions)
-    except: return jsonify([])
+    except: return jsonify(suggestions)
+
+def build_feed():
+    results = yt.search("Top Global Hits", filter='songs', limit=15)
+    formatted = []
+    for r in results:
+        if 'videoId' not in r: continue
+        formatted.append({
+            'id': r['videoId'],
+            'title': r['title'],
+            'artist': r['artists'][0]['name'],
+            'cover': r['thumbnails'][-1]['url'],
+            'duration': r.get('duration', '0:00'),
+            'stream_url': f"/api/stream/{r['videoId']}"
+        })
+    return formatted
 
 @content_bp.route('/feed', methods=['GET'])
 def feed():
-    try:
-        results = yt.search("Top Global Hits", filter='songs', limit=15)
-        formatted = []
-        for r in results:
-            if 'videoId' not in r: continue
-            formatted.append({
-                'id': r['videoId'],
-                'title': r['title'],
-                'artist': r['artists'][0]['name'],
-                'cover': r['thumbnails'][-1]['url'],
-                'duration': r.get('duration', '0:00'),
-                'stream_url': f"/api/stream/{r['videoId']}"
-            })
-        return jsonify(formatted)
-    except: return jsonify([])
+    return snapshots.response('feed', default=[])
+
+def feed_fallback():
+    # Same tracks as /feed, without the shared-cache headers (the callers are per-user endpoints)
+    return jsonify(snapshots.payload('feed', default=[]))
+
+def build_podcasts():
+    # Use playlists filter for podcasts
+    results = yt.search("podcast", filter="playlists", limit=20)
+    formatted = []
+    for r in results:
+        if 'browseId' not in r: continue
+        formatted.append({
+            'id': r['browseId'],
+            'title': r.get('title', 'Unknown'),
+            'artist': r.get('author', 'Unknown'),
+            'cover': r['thumbnails'][-1]['url'] if 'thumbnails' in r else '',
+            'type': 'podcast'
+        })
+    return formatted
 
 @content_bp.route('/podcasts', methods=['GET'])
 def get_podcasts():
-    try:
-        # Use playlists filter for podcasts
-        results = yt.search("podcast", filter="playlists", limit=20)
-        formatted = []
-        for r in results:
-            if 'browseId' not in r: continue
-            formatted.append({
-                'id': r['browseId'],
-                'title': r.get('title', 'Unknown'),
-                'artist': r.get('author', 'Unknown'),
-                'cover': r['thumbnails'][-1]['url'] if 'thumbnails' in r else '',
-                'type': 'podcast'
-            })
-        return jsonify(formatted)
-    except: return jsonify([])
+    return snapshots.response('podcasts', default=[])
 
-@content_bp.route('/podcasts/<string:browse_id>', methods=['GET'])
-def get_podcast_episodes(browse_id):
-    try:
-        data = None
-        # Try finding as playlist first (most common for 'podcasts' on YT)
-        try: data = yt.get_playlist(browse_id, limit=50)
-        except: pass
-        
-        if not data:
-            try: data = yt.get_podcast(browse_id, limit=50)
-            except: pass
+# Episode lists by browse_id and depth (PODCAST_PAGE_SIZE doubling), for every worker
+podcast_cache = SWRCache('podcast_episodes', Config.PODCAST_CACHE_TTL, Config.PODCAST_CACHE_STALE_TTL, max_entries=2048)
 
-        if not data:
-            return jsonify({'title': 'Error loading podcast', 'episodes': []}), 200
+def fetch_podcast(browse_id, depth):
+    """The first `depth` episodes of a podcast, formatted. Raises when YTMusic has nothing for it."""
+    data = None
+    # Try finding as playlist first (most common for 'podcasts' on YT)
+    try: data = yt.get_playlist(browse_id, limit=depth)
+    except Exception as e: print(f"Podcast {browse_id} as playlist failed: {e}")
 
-        episodes = []
-        tracks = data.get('tracks', []) or data.get('contents', [])
+    if not data:
+        data = yt.get_podcast(browse_id, limit=depth)
+    if not data:
+        raise ValueError(f"No podcast {browse_id}")
 
-        for t in tracks:
-            if 'videoId' not in t: continue
-            artist = data.get('title', 'Podcast')
-            if 'artists' in t and t['artists']: artist = t['artists'][0]['name']
+    episodes = []
+    tracks = data.get('tracks', []) or data.get('contents', [])
 
-            episodes.append({
-                'id': t['videoId'],
-                'title': t.get('title', 'Unknown'),
-                'artist': artist,
-                'cover': t.get('thumbnails', [{'url': ''}])[-1]['url'] if t.get('thumbnails') else (data.get('thumbnails', [{'url': ''}])[-1]['url']),
-                'duration': t.get('duration', '0:00'),
-                'stream_url': f"/api/stream/{t['videoId']}"
-            })
+    for t in tracks:
+        if 'videoId' not in t: continue
+        artist = data.get('title', 'Podcast')
+        if 'artists' in t and t['artists']: artist = t['artists'][0]['name']
+
+        episodes.append({
+            'id': t['videoId'],
+            'title': t.get('title', 'Unknown'),
+            'artist': artist,
+            'cover': t.get('thumbnails', [{'url': ''}])[-1]['url'] if t.get('thumbnails') else (data.get('thumbnails', [{'url': ''}])[-1]['url']),
+            'duration': t.get('duration', '0:00'),
+            'stream_url': f"/api/stream/{t['videoId']}"
+        })
+    return {
+        'title': data.get('title', 'Podcast'),
+        'description': data.get('description', ''),
+        'cover': data['thumbnails'][-1]['url'] if data.get('thumbnails') else '',
+        'episodes': episodes,
+        # Fewer than asked for: that is the whole show, no need to ever go deeper
+        'complete': len(tracks) < depth or depth >= Config.PODCAST_MAX_EPISODES
+    }
+
+def get_podcast(browse_id, needed):
+    """
+    Cached podcast with at least `needed` episodes (or all of them).
+    Depths double, so browsing far into a show takes a few fetches rather than one per page,
+    and a cached shallower list that is already complete answers without any.
+    """
+    depth = Config.PODCAST_PAGE_SIZE
+    while True:
+        cached = podcast_cache.cache.get(f"{browse_id}:{depth}")
+        if cached and cached['value']['complete']:
+            return podcast_cache.get(f"{browse_id}:{depth}", lambda d=depth: fetch_podcast(browse_id, d))
+        if depth >= needed or depth >= Config.PODCAST_MAX_EPISODES: break
+        depth = min(depth * 2, Config.PODCAST_MAX_EPISODES)
+    return podcast_cache.get(f"{browse_id}:{depth}", lambda: fetch_podcast(browse_id, depth))
+
+@content_bp.route('/podcasts/<string:browse_id>', methods=['GET'])
+def get_podcast_episodes(browse_id):
+    """
+    One page of episodes. ?cursor= is the offset returned as next_cursor by the previous page
+    (none for the first), next_cursor is null after the last one.
+    """
+    cursor = request.args.get('cursor', '0')
+    offset = int(cursor) if cursor.isdigit() else 0
+    limit = min(max(request.args.get('limit', Config.PODCAST_PAGE_SIZE, type=int), 1), 100)
+    try:
+        podcast = get_podcast(browse_id, offset + limit)
+        episodes = podcast['episodes'][offset:offset + limit]
+        more = offset + limit < len(podcast['episodes']) or not podcast['complete']
         return jsonify({
-            'title': data.get('title', 'Podcast'),
-            'description': data.get('description', ''),
-            'cover': data['thumbnails'][-1]['url'] if data.get('thumbnails') else '',
-            'episodes': episodes
+            'title': podcast['title'],
+            'description': podcast['description'],
+            'cover': podcast['cover'],
+            'episodes': episodes,
+            'next_cursor': str(offset + limit) if more and episodes else None
         })
-    except Exception:
-        return jsonify({'title': 'Error loading podcast', 'episodes': []}), 200
+    except Exception as e:
+        print(f"Podcast Error for {browse_id}: {e}")
+        return jsonify({'title': 'Error loading podcast', 'episodes': [], 'next_cursor': None}), 200
+
+def recommended_tracks(user_id, limit):
+    """Personalized tracks from the local co-occurrence engine, [] for cold-start users."""
+    try:
+        recommender.ensure_built(current_app._get_current_object())
+        track_ids = recommender.recommend(user_id, limit)
+    except Exception as e:
+        print(f"Recommender Error: {e}")
+        return []
+    if len(track_ids) < Config.RECOMMENDER_MIN_RESULTS: return []
+
+    tracks = {t.id: t for t in Track.query.filter(Track.id.in_(track_ids)).all()}
+    return [{
+        'id': tracks[tid].video_id,
+        'title': tracks[tid].title,
+        'artist': tracks[tid].artist or 'Unknown',
+        'cover': tracks[tid].cover_url or '',
+        'duration': tracks[tid].duration or '0:00',
+        'stream_url': tracks[tid].stream_url
+    } for tid in track_ids if tid in tracks]
 
 @content_bp.route('/recommendations', methods=['GET'])
 def get_recommendations():
     current_user_id = optional_get_identity()
-    if not current_user_id: return feed()
+    if not current_user_id: return feed_fallback()
 
     try:
         user = User.query.get(current_user_id)
+
+        # Our own likes/plays/playlists first, YTMusic radio only for users we know nothing about
+        formatted = recommended_tracks(user.id, 20)
+        if formatted:
+            prefetch_streams(formatted)
+            return jsonify(formatted)
+
         history = RecentlyPlayed.query.filter_by(user_id=current_user_id).order_by(RecentlyPlayed.last_played.desc()).limit(5).all()
         
         seeds = [t.video_id for t in user.liked_tracks[-3:]]
         seeds += [h.track.video_id for h in history[:3] if h.track]
         unique_seeds = list(set(seeds))
         
-        if not unique_seeds: return feed()
+        if not unique_seeds: return feed_fallback()
 
         seed_id = random.choice(unique_seeds)
-        radio = yt.get_watch_playlist(videoId=seed_id, limit=20)
+        formatted = get_watch_tracks(seed_id, 20)
         
-        if 'tracks' in radio:
-            return jsonify([{
-                'id': t['videoId'],
-                'title': t['title'],
-                'artist': t['artists'][0]['name'] if 'artists' in t else 'Unknown',
-                'cover': t.get('thumbnails', t.get('thumbnail', [{'url':''}]))[-1]['url'],
-                'duration': '0:00',
-                'stream_url': f"/api/stream/{t['videoId']}"
-            } for t in radio['tracks'] if 'videoId' in t])
+        if formatted:
+            prefetch_streams(formatted)
+            return jsonify(formatted)
             
-        return feed()
-    except: return feed()
+        return feed_fallback()
+    except: return feed_fallback()
+
+# Flow sessions: position, what was served and where the mix goes next, shared by all workers
+flow_sessions = SharedCache('flow_sessions', max_entries=4096)
+# Fallback seeds (popular songs: Blinding Lights, Starboy, etc)
+FLOW_FALLBACK_SEEDS = ["4NRXx6U8ABQ", "34Na4j8AVgA", "fHI8X4OXluQ"]
+
+def new_flow_session(user_id):
+    session = {
+        'id': uuid.uuid4().hex, 'owner': user_id, 'user_id': None, 'position': 0, 'last_page': [],
+        'heard': [], 'seeds': [], 'local_done': True
+    }
+    user = User.query.get(user_id) if user_id else None
+    if user:
+        # Recently played counts as heard; history and likes seed the radio chain
+        history = RecentlyPlayed.query.filter_by(user_id=user.id).order_by(RecentlyPlayed.last_played.desc()).limit(50).all()
+        session['heard'] = [h.track.video_id for h in history if h.track]
+        session['seeds'] = session['heard'][:10] + [t.video_id for t in user.liked_tracks[-10:]]
+        session['user_id'] = user.id
+        session['local_done'] = False
+    random.shuffle(session['seeds'])
+    if not session['seeds']:
+        session['seeds'] = list(FLOW_FALLBACK_SEEDS)
+    return session
+
+def next_flow_tracks(session, need):
+    """
+    Up to `need` tracks this session hasn't heard, pulled lazily from local recommendations,
+    then a radio chain (every seed's queue provides the next seeds), then the feed.
+    """
+    heard = set(session['heard'])
+    fresh = []
+    def take(tracks):
+        for t in tracks:
+            if t['id'] not in heard:
+                heard.add(t['id'])
+                fresh.append(t)
+
+    if not session['local_done']:
+        # The engine excludes the user's own tracks already, ask one page deeper each time
+        before = len(fresh)
+        take(recommended_tracks(session['user_id'], session['position'] + need))
+        if len(fresh) == before: session['local_done'] = True
+
+    fetches = 0
+    while len(fresh) < need and session['seeds'] and fetches < Config.FLOW_MAX_FETCHES:
+        seed = session['seeds'].pop(0)
+        fetches += 1
+        try: tracks = list(get_watch_tracks(seed, 25))
+        except Exception as e:
+            print(f"Flow seed {seed} failed: {e}")
+            continue
+        random.shuffle(tracks)
+        before = len(fresh)
+        take(tracks)
+        session['seeds'].extend(t['id'] for t in fresh[before:before + 3])
+
+    if not fresh and not session['seeds']:
+        take(snapshots.payload('feed', default=[]))
+
+    fresh = fresh[:need]
+    # Shuffle slightly for "Freshness" feeling
+    random.shuffle(fresh)
+    session['heard'] = (session['heard'] + [t['id'] for t in fresh])[-Config.FLOW_MAX_HEARD:]
+    session['seeds'] = session['seeds'][-100:]
+    return fresh
+
+def flow_page(cursor, user_id):
+    """(tracks, next cursor) for a cursor "<session>.<position>", a new session for none or an unknown one."""
+    session_id, _, position = (cursor or '').partition('.')
+    # Sessions move on in every worker: always read them from disk, never this worker's copy
+    session = flow_sessions.get_from_disk(session_id) if session_id else None
+    if session is None or session['owner'] != user_id:
+        session = new_flow_session(user_id)
+        position = '0'
+
+    with FileLock(f"flow:{session['id'][:2]}", timeout=5):  # 256 lock stripes, not one file per session
+        session = flow_sessions.get_from_disk(session['id']) or session
+        position = int(position) if position.isdigit() else session['position']
+        if position != session['position'] - len(session['last_page']) or not session['last_page']:
+            # Current cursor (or an older one): next page. Never serves anything twice.
+            session['last_page'] = next_flow_tracks(session, Config.FLOW_PAGE_SIZE)
+            session['position'] += len(session['last_page'])
+            flow_sessions.set(session['id'], session, Config.FLOW_SESSION_TTL)
+        # Otherwise a retry of the last page: same tracks again, nothing skipped
+    return session['last_page'], f"{session['id']}.{session['position']}"
 
 @content_bp.route('/flow', methods=['GET'])
 def get_flow():
     """
-    Generates a personalized 'Flow' (infinite mix) for the user.
+    Personalized 'Flow' (infinite mix), one page per call.
     If logged in: Based on likes/history.
     If guest: Based on global hits but randomized.
+    The next page's cursor comes back in X-Flow-Cursor; pass it as ?cursor= to continue the
+    same mix without repeats. Without one a new session starts.
     """
     try:
-        current_user_id = optional_get_identity()
-        seeds = []
-        
-        if current_user_id:
-            user = User.query.get(current_user_id)
-            if user:
-                # 1. Get recent history seeds
-                history = RecentlyPlayed.query.filter_by(user_id=current_user_id).order_by(RecentlyPlayed.last_played.desc()).limit(10).all()
-                seeds += [h.track.video_id for h in history if h.track]
-                
-                # 2. Get liked songs seeds
-                seeds += [t.video_id for t in user.liked_tracks[-10:]]
-        
-        # 3. Fallback or Guest: Use a popular song as seed if no auth/history
-        if not seeds:
-            # Fallback seeds (popular songs: Blinding Lights, Starboy, etc)
-            seeds = ["4NRXx6U8ABQ", "34Na4j8AVgA", "fHI8X4OXluQ"] 
-            
-        seed_id = random.choice(seeds)
-        
-        # Get a Watch Playlist (Radio) based on the seed
-        radio = yt.get_watch_playlist(videoId=seed_id, limit=25)
-        
-        if 'tracks' in radio:
-            formatted = [{
-                'id': t['videoId'],
-                'title': t['title'],
-                'artist': t['artists'][0]['name'] if 'artists' in t else 'Unknown',
-                'cover': t.get('thumbnails', t.get('thumbnail', [{'url':''}]))[-1]['url'],
-                'duration': '0:00',
-                'stream_url': f"/api/stream/{t['videoId']}"
-            } for t in radio['tracks'] if 'videoId' in t]
-            
-            # Shuffle slightly for "Freshness" feeling
-            random.shuffle(formatted)
-            return jsonify(formatted)
-            
-        return feed()
+        tracks, next_cursor = flow_page(request.args.get('cursor'), optional_get_identity())
+        if not tracks:
+            return feed_fallback()
+        prefetch_streams(tracks)
+        response = jsonify(tracks)
+        response.headers['X-Flow-Cursor'] = next_cursor
+        response.headers['Access-Control-Expose-Headers'] = 'X-Flow-Cursor'
+        return response
     except Exception as e:
         print(f"Flow Error: {e}")
-        return feed()
+        return feed_fallback()
 
 @content_bp.route('/radio/<video_id>', methods=['GET'])
 def get_radio(video_id):
     try:
-        # 1. Get Standard Radio (Based on current song)
-        radio_tracks = []
-        try:
-            radio = yt.get_watch_playlist(videoId=video_id, limit=20)
-            if 'tracks' in radio:
-                radio_tracks = [{
-                    'id': t['videoId'],
-                    'title': t['title'],
-                    'artist': t['artists'][0]['name'] if 'artists' in t else 'Unknown',
-                    'cover': t.get('thumbnails', t.get('thumbnail', [{'url':''}]))[-1]['url'],
-                    'duration': '0:00',
-                    'stream_url': f"/api/stream/{t['videoId']}"
-                } for t in radio['tracks'] if 'videoId' in t]
-        except: pass
-
-        # 2. Get User Taste Radio (If logged in)
-        taste_tracks = []
+        # 1. Pick the User Taste seed (If logged in)
+        seed_id = None
         current_user_id = optional_get_identity()
         if current_user_id:
             try:
@@ -286,20 +513,14 @@ def get_radio(video_id):
                         # Pick a random seed different from current video if possible
                         valid_seeds = [s for s in unique_seeds if s != video_id]
                         seed_id = random.choice(valid_seeds) if valid_seeds else video_id
-                        
-                        user_radio = yt.get_watch_playlist(videoId=seed_id, limit=20)
-                        if 'tracks' in user_radio:
-                            taste_tracks = [{
-                                'id': t['videoId'],
-                                'title': t['title'],
-                                'artist': t['artists'][0]['name'] if 'artists' in t else 'Unknown',
-                                'cover': t.get('thumbnails', t.get('thumbnail', [{'url':''}]))[-1]['url'],
-                                'duration': '0:00',
-                                'stream_url': f"/api/stream/{t['videoId']}"
-                            } for t in user_radio['tracks'] if 'videoId' in t]
             except Exception as e:
                 print(f"Taste fetch error: {e}")
 
+        # 2. Standard Radio (based on current song) and Taste Radio, fetched together
+        queues = get_watch_tracks_many([video_id] + ([seed_id] if seed_id and seed_id != video_id else []), 20)
+        radio_tracks = queues.get(video_id, [])
+        taste_tracks = queues.get(seed_id, []) if seed_id else []
+
         # 3. Interleave Results (Radio, Taste, Radio, Taste...)
         final_list = []
         max_len = max(len(radio_tracks), len(taste_tracks))
@@ -320,32 +541,44 @@ def get_radio(video_id):
                     final_list.append(track)
                     seen_ids.add(track['id'])
         
+        prefetch_streams(final_list)
         return jsonify(final_list)
     except Exception as e: 
         print(f"Get Radio Error: {e}")
         return jsonify([])
 
+DISCOVER_QUERIES = {
+    'featured': "Global Top 50",
+    'electronic': "Electronic Dance Music Hits",
+    'hiphop': "Hip Hop R&B Hits",
+    'trending': "Trending Songs"
+}
+
+def format_discover(results):
+    data = []
+    for r in results:
+        if 'videoId' in r:
+            data.append({
+                'id': r['videoId'],
+                'title': r['title'],
+                'artist': r['artists'][0]['name'] if 'artists' in r else 'Unknown',
+                'cover': r['thumbnails'][-1]['url'] if 'thumbnails' in r else '',
+                'duration': r.get('duration', '0:00'),
+                'stream_url': f"/api/stream/{r['videoId']}"
+            })
+    return data
+
 @content_bp.route('/discover/<category>', methods=['GET'])
 def get_discover(category):
+    if category in DISCOVER_QUERIES:
+        return snapshots.response(f"discover_{category}", default=[])
+    # Free-form categories can't be precomputed, they go through the search cache
     try:
-        query = {
-            'featured': "Global Top 50",
-            'electronic': "Electronic Dance Music Hits",
-            'hiphop': "Hip Hop R&B Hits",
-            'trending': "Trending Songs"
-        }.get(category, f"{category} music")
-
-        results = yt.search(query, filter='songs', limit=10)
-        data = []
-        for r in results:
-            if 'videoId' in r:
-                data.append({
-                    'id': r['videoId'],
-                    'title': r['title'],
-                    'artist': r['artists'][0]['name'] if 'artists' in r else 'Unknown',
-                    'cover': r['thumbnails'][-1]['url'] if 'thumbnails' in r else '',
-                    'duration': r.get('duration', '0:00'),
-                    'stream_url': f"/api/stream/{r['videoId']}"
-                })
-        return jsonify(data)
+        return jsonify(format_discover(cached_search(f"{category} music", 'songs', 10)))
     except: return jsonify([])
+
+# Home page snapshots, rebuilt in the background every SNAPSHOT_INTERVAL
+snapshots.register('feed', build_feed)
+snapshots.register('podcasts', build_podcasts)
+for _category, _query in DISCOVER_QUERIES.items():
+    snapshots.register(f"discover_{_category}", lambda q=_query: format_discover(yt.search(q, filter='songs', limit=10)))
@@ -2,6 +2,7 @@ from flask import Blueprint, jsonify, request
 from flask_cors import cross_origin
 from server.models import db, User, Track, RecentlyPlayed
 from server.utils import optional_get_identity
+from server.recommender import recommender
 from datetime import datetime
 
 interactions_bp = Blueprint('interactions', __name__)
@@ -16,7 +17,7 @@ def get_likes():
         'title': t.title,
         'artist': t.artist,
         'cover': t.cover_url,
-        'stream_url': f"/api/stream/{t.video_id}"
+        'stream_url': t.stream_url
     } for t in user.liked_tracks]), 200
 
 @interactions_bp.route('/likes', methods=['POST'])
@@ -50,6 +51,8 @@ def toggle_like():
         liked = True
 
     db.session.commit()
+    if liked: recommender.add(f"likes:{user.id}", track.id)
+    else: recommender.remove(f"likes:{user.id}", track.id)
     return jsonify({'message': f'Track {action}', 'liked': liked}), 200
 
 @interactions_bp.route('/history/update', methods=['POST'])
@@ -84,6 +87,7 @@ def update_history():
         db.session.add(RecentlyPlayed(user_id=current_user_id, track_id=track.id, timestamp=data.get('timestamp', 0)))
 
     db.session.commit()
+    recommender.add(f"plays:{current_user_id}", track.id)
     return jsonify({'status': 'ok'})
 
 @interactions_bp.route('/history', methods=['GET'])
@@ -102,7 +106,7 @@ def get_history():
                 'artist': h.track.artist,
                 'cover': h.track.cover_url,
                 'duration': h.track.duration,
-                'stream_url': f"/api/stream/{h.track.video_id}",
+                'stream_url': h.track.stream_url,
                 'resume_time': h.timestamp
             })
     return jsonify(valid_history), 200
@@ -132,4 +136,5 @@ def delete_history_item(video_id):
     for entry in entries:
         db.session.delete(entry)
     db.session.commit()
+    recommender.remove(f"plays:{current_user_id}", track.id)
     return jsonify({'message': 'History item removed'}), 200
@@ -1,14 +1,31 @@
 import os
-import glob
-import requests
-from flask import Blueprint, jsonify, request, make_response, Response
-from yt_dlp import YoutubeDL
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, jsonify, request, Response, send_file
+from werkzeug.wsgi import wrap_file
 from ytmusicapi import YTMusic
 from server.config import Config
+from server.cache import SharedCache, SingleFlight
+from server.resolver import UpstreamAudio, UpstreamChanged, build_candidates, run_scored
+from server.segment_cache import segment_cache, parse_range
+from server.image_cache import image_cache, ImageUpstreamError, ImageTooLarge
+from server.upstream import scoreboard, http_get, relay, Deadline
+from server.metrics import metrics
+from server.uploads import find_local_track
 
 player_bp = Blueprint('player', __name__)
 yt = YTMusic()
-ALLOWED_EXTENSIONS = {'mp3', 'wav', 'ogg', 'm4a'}
+
+# Lyrics by video_id for every worker. Misses are stored too, for a shorter time, so tracks
+# without lyrics don't query both sources on every play.
+lyrics_cache = SharedCache('lyrics', max_entries=4096)
+lyrics_lookups = SingleFlight()
+lyrics_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='lyrics')
+LYRICS_MISSING = {'type': None, 'lyrics': None}
+
+AUDIO_MIMETYPES = {'mp3': 'audio/mpeg', 'wav': 'audio/wav', 'ogg': 'audio/ogg', 'm4a': 'audio/mp4'}
 
 @player_bp.route('/version')
 def version():
@@ -25,334 +42,187 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 def proxy_image():
     url = request.args.get('url')
     if not url: return jsonify({'error': 'No URL provided'}), 400
+    size = request.args.get('size', type=int)
     try:
-        # Use a standard browser User-Agent
-        req_headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        # Verify=False to bypass SSL issues on Render/cloud environments
-        # stream=True ensures we don't load massive files into memory at once
-        resp = requests.get(url, headers=req_headers, stream=True, timeout=10, verify=False)
-        
-        # If upstream failed, pass that status code along (don't error out 500)
-        if resp.status_code != 200:
-             return jsonify({'error': f'Upstream error {resp.status_code}'}), resp.status_code
-
-        excluded_headers = ['content-encoding', 'content-length', 'transfer-encoding', 'connection']
-        headers = [(name, value) for (name, value) in resp.raw.headers.items()
-                   if name.lower() not in excluded_headers]
-        
-        response = make_response(resp.content)
-        for name, value in headers:
-            response.headers[name] = value
-            
+        # Resized once per (url, size), then served from disk. The blob hash is a strong ETag,
+        # so a revalidation with If-None-Match gets a 304 without touching the origin.
+        entry = image_cache.get(url, image_cache.snap_size(size))
+        response = send_file(
+            image_cache.path(entry),
+            mimetype=entry['mimetype'],
+            etag=entry['hash'],
+            conditional=True,
+            max_age=Config.IMAGE_CACHE_TTL
+        )
         response.headers['Access-Control-Allow-Origin'] = '*'
         return response
-        
+
+    except ImageUpstreamError as e:
+        # If upstream failed, pass that status code along (don't error out 500)
+        return jsonify({'error': str(e)}), e.status
+    except ImageTooLarge as e:
+        return jsonify({'error': str(e)}), 502
     except Exception as e:
         print(f"Proxy Error for {url}: {e}")
         return jsonify({'error': 'Failed to fetch image'}), 500
 
-# Cache for Piped instances
-piped_instances_cache = []
-last_piped_fetch = 0
-
-def get_healthy_piped_instances():
-    global piped_instances_cache, last_piped_fetch
-    import time
-    if piped_instances_cache and (time.time() - last_piped_fetch < 3600): # Cache for 1 hour
-        return piped_instances_cache
-
-    # Hardcoded robust list found online (Piped instances)
-    # Filtered out dead/DNS-failing instances from previous debug logs
-    fallback_instances = [
-        "https://piped.video",
-        "https://piped.mha.fi", 
-        "https://piped.smnz.de",
-        "https://piped.kavin.rocks",
-        "https://piped.projectsegfau.lt",
-        "https://piped.r4fo.com",
-        "https://piped.lunar.icu",
-        "https://piped.privacy.com.de",
-        "https://piped.tokhmi.xyz", 
-        "https://piped.adminforge.de",
-        "https://piped.hostux.net",
-        "https://piped.chamuditha.com"
-    ]
-
-    try:
-        print("[Player] Fetching fresh Piped instances...")
-        res = requests.get("https://piped-instances.kavin.rocks/", timeout=5, verify=False)
-        if res.status_code == 200:
-            instances = res.json()
-            # Filter: up-to-date, healthy, and has https
-            healthy = [
-                i['api_url'] for i in instances 
-                if i.get('api_url') and i.get('uptime_24h', 0) > 90 and 'https' in i['api_url']
-            ]
-            # Prioritize official/known fast ones if in the list
-            priority = ["https://piped.video", "https://piped.mha.fi"]
-            sorted_instances = [h for h in healthy if h in priority] + [h for h in healthy if h not in priority]
-            
-            # Combine with fallback to ensure we have a good list
-            final_list = sorted_instances + [f for f in fallback_instances if f not in sorted_instances]
-            
-            piped_instances_cache = final_list[:15] # Keep top 15
-            last_piped_fetch = time.time()
-            return piped_instances_cache
-    except Exception as e:
-        print(f"[Player] Failed to fetch Piped instances: {e}")
-    
-    # Fallback if fetch fails
-    return fallback_instances
+def range_start(range_header):
+    """First byte of an open or closed `bytes=N-[M]` range, 0 otherwise."""
+    match = re.match(r'^\s*bytes\s*=\s*(\d+)\s*-', range_header or '')
+    return int(match.group(1)) if match else 0
+
+class FileRange:
+    """
+    `length` bytes of an open file from `start`, as a file object for wsgi.file_wrapper.
+    gunicorn sendfile()s from the current offset for Content-Length bytes; servers that
+    iterate the wrapper instead get read() capped at the range.
+    """
+
+    def __init__(self, f, start, length):
+        f.seek(start)
+        self.f = f
+        self.remaining = length
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self.f.seek(offset, whence)
+
+    def read(self, size=-1):
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.f.close()
+
+def send_local_track(path):
+    """
+    An uploaded file, with Range/206 done here rather than by send_file: werkzeug copies ranged
+    bodies through Python, while wsgi.file_wrapper over a FileRange lets gunicorn sendfile() them
+    (zero-copy, and <audio> always sends Range).
+    """
+    mimetype = AUDIO_MIMETYPES.get(path.rsplit('.', 1)[1], 'audio/mpeg')
+    range_header = request.headers.get('Range')
+    if not range_header:
+        response = send_file(path, mimetype=mimetype, conditional=True, max_age=86400)
+    else:
+        size = os.path.getsize(path)
+        span = parse_range(range_header, size)
+        if not span:
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}', 'Access-Control-Allow-Origin': '*'})
+        start, end = span
+        body = wrap_file(request.environ, FileRange(open(path, 'rb'), start, end - start + 1))
+        response = Response(body, status=206, mimetype=mimetype, direct_passthrough=True)
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response.content_length = end - start + 1
+        response.cache_control.public = True
+        response.cache_control.max_age = 86400
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    metrics.inc('mewzy_stream_bytes_total', response.content_length or 0, source='local')
+    return response
 
 @player_bp.route('/stream/<video_id>')
 def stream_track(video_id):
     errors = []
+    started = time.monotonic()
     try:
         # Sanitize video_id
         video_id = video_id.replace('*', '').strip()
-        url = None
-        
-        # Helper logs
-        def get_proxy_headers():
-             return {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Referer': 'https://www.google.com/'
-            }
-
-        # Strategy 1 (formerly 4): Cobalt API (Multiple Instances & Dual Payload)
-        # Iterate through multiple Cobalt instances
-        cobalt_instances = [
-            "https://api.cobalt.tools/api/json",
-            "https://cobalt.kwiatekmiki.pl/api/json",
-            "https://cobalt.laccds.com/api/json",
-            "https://xp.nw.r.appspot.com/api/json", 
-            "https://api.cobalt.cool/api/json",
-            "https://cobalt.tools/api/json",
-            "https://cobalt.synced.sh/api/json"
-        ]
-        
-        cobalt_headers = {
-            'Accept': 'application/json',
-            'Content-Type': 'application/json',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        
-        # Payload A: Strict/New (v10/v7)
-        payload_a = {
-            'url': f'https://www.youtube.com/watch?v={video_id}',
-            'vCodec': 'h264',
-            'vQuality': '720',
-            'aFormat': 'mp3',
-            'isAudioOnly': True
-        }
-        # Payload B: Legacy/Simple
-        payload_b = {
-            'url': f'https://www.youtube.com/watch?v={video_id}',
-            'downloadMode': 'audio'
-        }
-
-        for cob_host in cobalt_instances:
-            try:
-                # Try Payload A
-                print(f"Strategy 1 (Cobalt {cob_host}): Requesting Payload A...")
-                cobalt_res = requests.post(cob_host, json=payload_a, headers=cobalt_headers, timeout=5, verify=False)
-                if cobalt_res.status_code == 200:
-                    data = cobalt_res.json()
-                    if 'url' in data:
-                        url = data['url']
-                        print(f"Strategy 1 Success: Found URL via {cob_host} (Payload A)")
-                        break
-                
-                # If Payload A fails (e.g. 400 Bad Request), Try Payload B
-                if cobalt_res.status_code == 400 or cobalt_res.status_code == 500:
-                     print(f"Strategy 1 (Cobalt {cob_host}): Requesting Payload B (Fallback)...")
-                     cobalt_res = requests.post(cob_host, json=payload_b, headers=cobalt_headers, timeout=5, verify=False)
-                     if cobalt_res.status_code == 200:
-                        data = cobalt_res.json()
-                        if 'url' in data:
-                            url = data['url']
-                            print(f"Strategy 1 Success: Found URL via {cob_host} (Payload B)")
-                            break
-                     else:
-                        errors.append(f"Strategy 1 ({cob_host}): Payload A/B failed ({cobalt_res.status_code})")
-                else:
-                     errors.append(f"Strategy 1 ({cob_host}): Status {cobalt_res.status_code}")
 
-            except Exception as e:
-                print(f"Strategy 1 ({cob_host}) failed: {e}")
-                errors.append(f"Strategy 1 ({cob_host}) Exception: {str(e)}")
+        # 0. Uploaded tracks live on our disk, no upstream calls
+        local_path = find_local_track(video_id)
+        if local_path:
+            return send_local_track(local_path)
 
-        # Strategy 2 (formerly 6): Piped API (Dynamic & Healthy)
-        if not url:
-            piped_instances = get_healthy_piped_instances()
-            for host in piped_instances:
-                try:
-                    print(f"Strategy 2 (Piped): Trying {host}...")
-                    piped_res = requests.get(f"{host}/streams/{video_id}", headers=get_proxy_headers(), timeout=5, verify=False)
-                    
-                    # Cloudflare check
-                    if piped_res.status_code == 200:
-                        if piped_res.text.strip().startswith('<'): # HTML detected
-                            print(f"Strategy 2 ({host}) blocked by Cloudflare (HTML response).")
-                            errors.append(f"Strategy 2 ({host}) blocked: Cloudflare HTML")
-                            continue
-
-                        data = piped_res.json()
-                        audio_streams = [s for s in data.get('audioStreams', []) if s.get('mimeType') and ('audio/mpeg' in s['mimeType'] or 'mp4' in s['mimeType'])]
-                        if audio_streams:
-                            audio_streams.sort(key=lambda x: x.get('bitrate', 0), reverse=True)
-                            url = audio_streams[0]['url']
-                            print(f"Strategy 2 Success: Found URL via {host}")
-                            break
-                        else:
-                             errors.append(f"Strategy 2 ({host}) failed: No audio streams found")
-                    elif piped_res.status_code in [403, 503, 429]:
-                        print(f"Strategy 2 ({host}) blocked: {piped_res.status_code}")
-                        errors.append(f"Strategy 2 ({host}) blocked: Status {piped_res.status_code}")
-                    else:
-                        errors.append(f"Strategy 2 ({host}) failed: Status {piped_res.status_code}")
-                except Exception as ex:
-                    print(f"Strategy 2 ({host}) failed: {ex}")
-                    errors.append(f"Strategy 2 ({host}) Exception: {str(ex)}")
-
-        # Strategy 3 (formerly 5): Invidious API (Promoted - higher success chance than Piped usually)
-        if not url:
-             # Try Invidious first, sometimes more reliable for raw streams
-            invidious_instances = [
-                "https://inv.nadeko.net",
-                "https://invidious.privacyredirect.com",
-                "https://yewtu.be",
-                "https://invidious.f5.si",
-                "https://vid.puffyan.us",
-                "https://invidious.drgns.space"
-            ]
-            for host in invidious_instances:
+        range_header = request.headers.get('Range')
+        upstream = UpstreamAudio(video_id, errors, budget=Config.STREAM_RESOLVE_BUDGET)
+
+        # 1. Body size: known from an earlier play, otherwise learnt from the first upstream response
+        meta = segment_cache.meta(video_id)
+        first_resp, first_resp_at = None, None
+        if meta:
+            # Upstream must serve the same file the cached segments came from
+            upstream.size, upstream.content_type = meta['size'], meta['content_type']
+            span = parse_range(range_header, meta['size'])
+            first_resp_at = segment_cache.first_missing(video_id, meta['size'], *span) if span else None
+            if first_resp_at is not None:
+                # Open the first missing run before answering, so a failed resolution is still a 500
                 try:
-                    print(f"Strategy 3 (Invidious): Trying {host}...")
-                    inv_res = requests.get(f"{host}/api/v1/videos/{video_id}", headers=get_proxy_headers(), timeout=5, verify=False)
-                    if inv_res.status_code == 200:
-                        data = inv_res.json()
-                        if 'formatStreams' in data:
-                            audio_streams = [s for s in data['formatStreams'] if 'audio' in s.get('type', '')]
-                            if not audio_streams and 'adaptiveFormats' in data:
-                                audio_streams = [s for s in data['adaptiveFormats'] if 'audio' in s.get('type', '')]
-                            
-                            if audio_streams:
-                                url = audio_streams[0]['url']
-                                print(f"Strategy 3 Success: Found URL via {host}")
-                                break
-                        else:
-                            errors.append(f"Strategy 3 ({host}) failed: No streams found")
-                    else:
-                        errors.append(f"Strategy 3 ({host}) failed: Status {inv_res.status_code}")
-                except Exception as ex:
-                    print(f"Strategy 3 ({host}) failed: {ex}")
-                    errors.append(f"Strategy 3 ({host}) Exception: {str(ex)}")
-
-        # Strategy 4: YoutubeDL (iOS Client)
-        if not url:
-            try:
-                ydl_opts = {
-                    'quiet': True,
-                    'format': 'bestaudio/best',
-                    'nocheckcertificate': True,
-                    'extractor_args': {'youtube': {'player_client': ['ios']}}
-                }
-                with YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(video_id, download=False)
-                    url = info.get('url')
-            except Exception as e:
-                print(f"Strategy 4 (iOS) failed: {e}")
-                errors.append(f"Strategy 4 (iOS) Exception: {str(e)}")
-
-        # Strategy 5: YoutubeDL (Android Client)
-        if not url:
-            try:
-                ydl_opts = {
-                    'quiet': True,
-                    'format': 'bestaudio/best',
-                    'nocheckcertificate': True,
-                    'extractor_args': {'youtube': {'player_client': ['android']}}
-                }
-                with YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(video_id, download=False)
-                    url = info.get('url')
-            except Exception as e:
-                print(f"Strategy 5 (Android) failed: {e}")
-                errors.append(f"Strategy 5 (Android) Exception: {str(e)}")
-
-        # Strategy 6: YoutubeDL (Web Client - Fallback)
-        if not url:
+                    first_resp = upstream.open(first_resp_at)
+                except UpstreamChanged as e:
+                    print(f"[Player] {video_id}: {e}, dropping its cached segments")
+                    segment_cache.drop(video_id)
+                    upstream.size = upstream.content_type = None
+                    meta, first_resp_at = None, None
+        if not meta:
+            first_resp_at = segment_cache.align(range_start(range_header))
+            first_resp = upstream.open(first_resp_at)
+            size = upstream.total_size(first_resp)
+            if size is None:
+                # Upstream can't do ranges (e.g. a transcoding tunnel): plain relay, nothing to cache
+                return Response(
+                    relay(first_resp, chunk_size=4096),
+                    status=first_resp.status_code,
+                    headers={
+                        'Content-Type': first_resp.headers.get('Content-Type', 'audio/mpeg'),
+                        'Access-Control-Allow-Origin': '*'
+                    }
+                )
+            meta = segment_cache.save_meta(video_id, size, first_resp.headers.get('Content-Type', 'audio/mpeg'))
+
+        size = meta['size']
+        span = parse_range(range_header, size)
+        if not span:
+            if first_resp is not None: first_resp.close()
+            return Response(status=416, headers={'Content-Range': f'bytes */{size}', 'Access-Control-Allow-Origin': '*'})
+        start, end = span
+
+        # 2. Serve cached segments from disk, fetch (and write through) only the missing runs.
+        # upstream.stream() reconnects on its own if the upstream body breaks off mid-run.
+        def fetch(first, last):
+            nonlocal first_resp
+            if first_resp is not None:
+                resp, first_resp = first_resp, None
+                if first == first_resp_at:
+                    return upstream.stream(first, last, resp=resp)
+                resp.close()
+            return upstream.stream(first, last)
+
+        source = 'cache' if first_resp is None else 'upstream'
+
+        def body():
+            nonlocal first_resp
+            sent = 0
             try:
-                ydl_opts = {
-                    'quiet': True,
-                    'format': 'bestaudio/best',
-                    'nocheckcertificate': True,
-                    'extractor_args': {'youtube': {'player_client': ['web']}}
-                }
-                with YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(video_id, download=False)
-                    url = info.get('url')
+                for chunk in segment_cache.read(video_id, start, end, size, fetch):
+                    if not sent:
+                        metrics.observe('mewzy_stream_ttfb_seconds', time.monotonic() - started, source=source)
+                    sent += len(chunk)
+                    yield chunk
+            except UpstreamChanged as e:
+                # A later run came from another file: stop here, the next play starts over
+                print(f"Stream Error ({video_id}, mid-body): {e}, dropping its cached segments")
+                segment_cache.drop(video_id)
             except Exception as e:
-                print(f"Strategy 6 (Web) failed: {e}")
-                errors.append(f"Strategy 6 (Web) Exception: {str(e)}")
-
-        # Strategy 7: YoutubeDL (TV Client - Last Resort)
-        if not url:
-            try:
-                ydl_opts = {
-                    'quiet': True,
-                    'format': 'bestaudio/best',
-                    'nocheckcertificate': True,
-                    'extractor_args': {'youtube': {'player_client': ['tv']}}
-                }
-                with YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(video_id, download=False)
-                    url = info.get('url')
-            except Exception as e:
-                print(f"Strategy 7 (TV) failed: {e}")
-                errors.append(f"Strategy 7 (TV) Exception: {str(e)}")
-
-        if not url:
-            response = jsonify({'error': 'All streaming strategies failed', 'details': errors})
-            response.headers.add('Access-Control-Allow-Origin', '*')
-            return response, 500
-        
-        # 2. Prepare headers with browser impersonation
-        proxy_headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': '*/*',
-            'Referer': 'https://www.youtube.com/'
+                print(f"Stream Error ({video_id}, mid-body): {e}")
+            finally:
+                metrics.inc('mewzy_stream_bytes_total', sent, source=source)
+                if first_resp is not None:
+                    first_resp.close()
+
+        headers = {
+            'Content-Type': meta['content_type'],
+            'Content-Length': str(end - start + 1),
+            'Accept-Ranges': 'bytes',
+            'Access-Control-Allow-Origin': '*'
         }
-        
-        range_header = request.headers.get('Range')
         if range_header:
-            proxy_headers['Range'] = range_header
-
-        # 3. Create Response (Stream Proxy)
-        req = requests.get(url, headers=proxy_headers, stream=True, timeout=10, verify=False)
-        
-        if req.status_code in [403, 410]:
-             response = jsonify({'error': f'Upstream Error ({req.status_code})', 'url': url})
-             response.headers.add('Access-Control-Allow-Origin', '*')
-             return response, 500
-            
-        return Response(
-            req.iter_content(chunk_size=4096),
-            status=req.status_code,
-            headers={
-                'Content-Type': req.headers.get('Content-Type', 'audio/mpeg'),
-                'Content-Length': req.headers.get('Content-Length'),
-                'Content-Range': req.headers.get('Content-Range'),
-                'Accept-Ranges': 'bytes',
-                'Access-Control-Allow-Origin': '*'
-            }
-        )
+            headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+        return Response(body(), status=206 if range_header else 200, headers=headers)
 
     except Exception as e:
         print(f"Stream Error: {e}")
@@ -360,37 +230,80 @@ def stream_track(video_id):
         response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
+def lrclib_lyrics(video_id):
+    """Synced (or plain) lyrics from LRCLIB, matched on title/artist/duration. None if it has none."""
+    song_info = yt.get_song(video_id)
+    title = song_info['videoDetails']['title']
+    artist = song_info['videoDetails']['author']
+    duration = int(song_info['videoDetails']['lengthSeconds'])
+
+    lrc_res = http_get(
+        "https://lrclib.net/api/get",
+        params={'artist_name': artist, 'track_name': title, 'duration': duration},
+        timeout=3, verify=True
+    )
+    if lrc_res.status_code == 404:
+        return None
+    if lrc_res.status_code != 200:
+        raise IOError(f"LRCLIB answered {lrc_res.status_code}")
+    data = lrc_res.json()
+    if data.get('syncedLyrics'):
+        return {'type': 'synced', 'lyrics': data['syncedLyrics']}
+    if data.get('plainLyrics'):
+        return {'type': 'plain', 'lyrics': data['plainLyrics']}
+    return None
+
+def ytmusic_lyrics(video_id):
+    """Plain lyrics from YouTube Music, None if the track has none."""
+    watch_data = yt.get_watch_playlist(videoId=video_id)
+    if not watch_data.get('lyrics'):
+        return None
+    lyrics_data = yt.get_lyrics(browseId=watch_data['lyrics'])
+    if lyrics_data and lyrics_data.get('lyrics'):
+        return {'type': 'plain', 'lyrics': lyrics_data['lyrics']}
+    return None
+
+def lookup_lyrics(video_id):
+    """
+    Ask both sources at once. LRCLIB wins whenever it has something (it may be synced),
+    YTMusic is the fallback. Returns (lyrics or None, definitive) where definitive is False
+    if a source that could have won errored, so the result of an outage is not remembered for long.
+    """
+    lookups = [lyrics_executor.submit(lrclib_lyrics, video_id), lyrics_executor.submit(ytmusic_lyrics, video_id)]
+    definitive = True
+    for future in lookups:
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Lyrics source failed for {video_id}: {e}")
+            definitive = False
+            continue
+        if result:
+            return result, definitive
+    return None, definitive
+
+def _lookup_and_cache(video_id):
+    result, definitive = lookup_lyrics(video_id)
+    if result:
+        # A fallback served while LRCLIB was down: look again soon instead of keeping it for LYRICS_TTL
+        lyrics_cache.set(video_id, result, Config.LYRICS_TTL if definitive else Config.LYRICS_MISS_TTL)
+    elif definitive:
+        lyrics_cache.set(video_id, LYRICS_MISSING, Config.LYRICS_MISS_TTL)
+    return result or LYRICS_MISSING
+
 @player_bp.route('/lyrics/<video_id>', methods=['GET'])
 def get_lyrics(video_id):
     try:
-        # Synced Lyrics (LRCLIB)
-        song_info = yt.get_song(video_id)
-        title = song_info['videoDetails']['title']
-        artist = song_info['videoDetails']['author']
-        duration = int(song_info['videoDetails']['lengthSeconds'])
-
-        try:
-            lrc_url = f"https://lrclib.net/api/get?artist_name={artist}&track_name={title}&duration={duration}"
-            lrc_res = requests.get(lrc_url, timeout=3)
-            if lrc_res.status_code == 200:
-                data = lrc_res.json()
-                if data.get('syncedLyrics'):
-                    return jsonify({'type': 'synced', 'lyrics': data['syncedLyrics']})
-                elif data.get('plainLyrics'):
-                    return jsonify({'type': 'plain', 'lyrics': data['plainLyrics']})
-        except: pass
-
-        # Fallback
-        watch_data = yt.get_watch_playlist(videoId=video_id)
-        if 'lyrics' in watch_data and watch_data['lyrics']:
-            lyrics_data = yt.get_lyrics(browseId=watch_data['lyrics'])
-            if lyrics_data and 'lyrics' in lyrics_data:
-                return jsonify({'type': 'plain', 'lyrics': lyrics_data['lyrics']})
-        
+        lyrics = lyrics_cache.get(video_id)
+        if lyrics is None:
+            lyrics = lyrics_lookups.do(video_id, lambda: _lookup_and_cache(video_id))
+        if lyrics.get('lyrics'):
+            return jsonify(lyrics)
         return jsonify({'error': 'Lyrics not found'}), 404
     except Exception as e:
         print(f"Lyrics Error: {e}")
         return jsonify({'error': 'Lyrics unavailable'}), 404
+
 @player_bp.route('/debug_stream/<video_id>')
 def debug_stream(video_id):
     # Sanitize video_id
@@ -404,131 +317,31 @@ def debug_stream(video_id):
         print(f"[DebugStream] {msg}")
 
     try:
-        # Helper logs
-        def get_proxy_headers():
-            return {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Referer': 'https://www.google.com/'
-            }
-
-        # Strategy 1 (formerly 4): Cobalt
-        if not success_url:
-            cobalt_instances = [
-                "https://api.cobalt.tools/api/json",
-                "https://cobalt.kwiatekmiki.pl/api/json",
-                "https://cobalt.laccds.com/api/json",
-                "https://xp.nw.r.appspot.com/api/json",
-                "https://api.cobalt.cool/api/json",
-                "https://cobalt.tools/api/json",
-                "https://cobalt.synced.sh/api/json"
-            ]
-            
-            # Payload A: Strict/New (v10/v7)
-            payload_a = {
-                'url': f'https://www.youtube.com/watch?v={video_id}',
-                'vCodec': 'h264',
-                'vQuality': '720',
-                'aFormat': 'mp3',
-                'isAudioOnly': True
-            }
-            # Payload B: Legacy/Simple
-            payload_b = {
-                'url': f'https://www.youtube.com/watch?v={video_id}',
-                'downloadMode': 'audio'
-            }
-
-            for cob_host in cobalt_instances:
-                try:
-                    log(f"Starting Strategy 1 (Cobalt {cob_host})...")
-                    res = requests.post(cob_host, json=payload_a, headers={'Accept': 'application/json', 'Content-Type': 'application/json'}, timeout=5, verify=False)
-                    log(f"Cobalt {cob_host} (Payload A) Status: {res.status_code}")
-                    if res.status_code == 200 and 'url' in res.json(): 
-                        success_url = res.json()['url']
-                        log(f"Strategy 1 Success: {cob_host} (Payload A)")
-                        break
-                    
-                    if res.status_code == 400 or res.status_code == 500:
-                        log(f"Cobalt {cob_host} (Payload B Fallback)...")
-                        res = requests.post(cob_host, json=payload_b, headers={'Accept': 'application/json', 'Content-Type': 'application/json'}, timeout=5, verify=False)
-                        log(f"Cobalt {cob_host} (Payload B) Status: {res.status_code}")
-                        if res.status_code == 200 and 'url' in res.json():
-                            success_url = res.json()['url']
-                            log(f"Strategy 1 Success: {cob_host} (Payload B)")
-                            break
-                except Exception as e: log(f"Strategy 1 Error {cob_host}: {e}")
-
-        # Strategy 2 (formerly 6): Piped (Dynamic)
-        if not success_url:
-            piped_instances = get_healthy_piped_instances()
-            for host in piped_instances:
-                try:
-                    log(f"Strategy 2 (Piped {host})...")
-                    res = requests.get(f"{host}/streams/{video_id}", headers=get_proxy_headers(), timeout=5, verify=False)
-                    log(f"Piped {host} Status: {res.status_code}")
-                    
-                    if res.status_code == 200:
-                        if res.text.strip().startswith('<'):
-                             log(f"Strategy 2 Failed: Cloudflare HTML detected")
-                             continue
-                        if res.json().get('audioStreams'): 
-                            success_url = res.json()['audioStreams'][0]['url']
-                            log("Strategy 2 Success")
-                            break
-                except Exception as e: log(f"Strategy 2 Error {host}: {e}")
-
-        # Strategy 3 (formerly 5): Invidious (Promoted)
-        if not success_url:
-            for host in ["https://inv.nadeko.net", "https://invidious.privacyredirect.com", "https://yewtu.be", "https://invidious.f5.si", "https://vid.puffyan.us", "https://invidious.drgns.space"]:
-                try:
-                    log(f"Strategy 3 (Invidious {host})...")
-                    res = requests.get(f"{host}/api/v1/videos/{video_id}", headers=get_proxy_headers(), timeout=5, verify=False)
-                    log(f"Invidious {host} Status: {res.status_code}")
-                    if res.status_code == 200:
-                         d = res.json()
-                         if d.get('formatStreams') or d.get('adaptiveFormats'): success_url = "found_in_invidious"; log("Strategy 3 Success"); break
-                except Exception as e: log(f"Strategy 3 Error {host}: {e}")
-
-        # Strategy 4: iOS
-        try:
-            log("Starting Strategy 4 (iOS)...")
-            ydl_opts = { 'quiet': True, 'format': 'bestaudio/best', 'nocheckcertificate': True, 'extractor_args': {'youtube': {'player_client': ['ios']}} }
-            with YoutubeDL(ydl_opts) as ydl:
-                info = ydl.extract_info(video_id, download=False)
-                if info.get('url'): success_url = info['url']; log("Strategy 4 Success")
-        except Exception as e: log(f"Strategy 4 Error: {e}")
-
-        # Strategy 5: Android
-        if not success_url:
-            try:
-                log("Starting Strategy 5 (Android)...")
-                ydl_opts = { 'quiet': True, 'format': 'bestaudio/best', 'nocheckcertificate': True, 'extractor_args': {'youtube': {'player_client': ['android']}} }
-                with YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(video_id, download=False)
-                    if info.get('url'): success_url = info['url']; log("Strategy 5 Success")
-            except Exception as e: log(f"Strategy 5 Error: {e}")
-            
-        # Strategy 6: Web Client
-        if not success_url:
+        # Same candidates (and ranking) as stream_track, but one at a time so each step is logged
+        cancel = threading.Event()
+        deadline = Deadline(Config.DEBUG_STREAM_BUDGET)
+        for label, host, attempt in build_candidates(video_id):
+            if deadline.expired():
+                log(f"Deadline exceeded ({Config.DEBUG_STREAM_BUDGET:g}s budget), stopping")
+                break
+            if not scoreboard.allow(host):
+                log(f"{label} Skipped: circuit open")
+                continue
             try:
-                log("Starting Strategy 6 (Web)...")
-                ydl_opts = { 'quiet': True, 'format': 'bestaudio/best', 'nocheckcertificate': True, 'extractor_args': {'youtube': {'player_client': ['web']}} }
-                with YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(video_id, download=False)
-                    if info.get('url'): success_url = info['url']; log("Strategy 6 Success")
-            except Exception as e: log(f"Strategy 6 Error: {e}")
-
-        # Strategy 7: TV Client
-        if not success_url:
-            try:
-                log("Starting Strategy 7 (TV)...")
-                ydl_opts = { 'quiet': True, 'format': 'bestaudio/best', 'nocheckcertificate': True, 'extractor_args': {'youtube': {'player_client': ['tv']}} }
-                with YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(video_id, download=False)
-                    if info.get('url'): success_url = info['url']; log("Strategy 7 Success")
-            except Exception as e: log(f"Strategy 7 Error: {e}")
+                log(f"Starting {label}...")
+                success_url = run_scored(host, attempt, cancel, deadline)
+                if success_url:
+                    log(f"{label} Success")
+                    break
+            except Exception as e: log(f"{label} Error: {e}")
 
-        return jsonify({'video_id': video_id, 'success': success_url is not None, 'logs': logs})
+        return jsonify({'video_id': video_id, 'success': success_url is not None, 'logs': logs, 'scoreboard': scoreboard.snapshot()})
 
     except Exception as e: return jsonify({'error': str(e), 'logs': logs}), 500
+
+@player_bp.route('/metrics')
+def get_metrics():
+    # Prometheus scrape target. Set METRICS_TOKEN to keep it private (Authorization: Bearer <token>).
+    if Config.METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {Config.METRICS_TOKEN}":
+        return jsonify({'error': 'Unauthorized'}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
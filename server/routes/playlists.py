@@ -2,6 +2,7 @@ from flask import Blueprint, jsonify, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from server.models import db, Playlist, Track
 from server.utils import optional_get_identity
+from server.recommender import recommender
 from ytmusicapi import YTMusic
 
 playlists_bp = Blueprint('playlists', __name__)
@@ -46,7 +47,7 @@ def get_playlist(playlist_id):
             'artist': t.artist,
             'cover': t.cover_url,
             'duration': t.duration,
-            'stream_url': f"/api/stream/{t.video_id}"
+            'stream_url': t.stream_url
         })
 
     return jsonify({'id': playlist.id, 'name': playlist.name, 'tracks': tracks}), 200
@@ -61,6 +62,7 @@ def delete_playlist(playlist_id):
 
     db.session.delete(playlist)
     db.session.commit()
+    recommender.remove_basket(f"playlist:{playlist_id}")
     return jsonify({'message': 'Playlist deleted'}), 200
 
 @playlists_bp.route('/<int:playlist_id>/tracks', methods=['POST'])
@@ -89,6 +91,7 @@ def add_to_playlist(playlist_id):
     if track not in playlist.tracks:
         playlist.tracks.append(track)
         db.session.commit()
+        recommender.add(f"playlist:{playlist.id}", track.id)
 
     return jsonify({'message': 'Added'}), 200
 
@@ -104,6 +107,7 @@ def remove_from_playlist(playlist_id, video_id):
     if track and track in playlist.tracks:
         playlist.tracks.remove(track)
         db.session.commit()
+        recommender.remove(f"playlist:{playlist.id}", track.id)
         return jsonify({'message': 'Track removed'}), 200
     
     return jsonify({'error': 'Track not in playlist'}), 404
@@ -156,6 +160,8 @@ def import_youtube_playlist():
                 count += 1
         
         db.session.commit()
+        for track in new_playlist.tracks:
+            recommender.add(f"playlist:{new_playlist.id}", track.id)
         return jsonify({'message': 'Imported', 'count': count, 'id': new_playlist.id}), 200
 
     except Exception as e:
@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+
+from server.config import Config
+from server.cache import atomic_write, DiskLRU
+
+
+def parse_range(header, size):
+    """
+    (start, end) inclusive for a `Range: bytes=...` header against a body of `size` bytes.
+    No header means the whole body. Returns None when the range can't be satisfied.
+    """
+    if not header:
+        return (0, size - 1) if size > 0 else None
+    match = re.match(r'^\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*$', header)
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+
+    first, last = match.group(1), match.group(2)
+    if not first:
+        # Suffix range: last N bytes
+        length = int(last)
+        if length == 0: return None
+        return (max(0, size - length), size - 1)
+
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return None
+    return (start, end)
+
+
+class SegmentCache:
+    """
+    On-disk cache of audio bodies split into fixed-size, aligned segments.
+    Layout: <folder>/<video_id>/meta.json + <size>-<index>.seg. Segment names carry the body size,
+    so a worker still writing an older file of another size can't mix it into the current one.
+    Segment files are written atomically so all workers can share the folder. Reads bump the
+    file mtime and eviction drops the least recently used segments once the folder is over max_bytes.
+    """
+
+    def __init__(self, folder, max_bytes, segment_size):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.segment_size = segment_size
+        os.makedirs(folder, exist_ok=True)
+        self._lru = DiskLRU(folder, max_bytes, 'SegmentCache', suffix='.seg')
+
+    def _dir(self, video_id):
+        safe = video_id if re.match(r'^[A-Za-z0-9_-]{1,64}$', video_id) else hashlib.sha1(video_id.encode()).hexdigest()
+        return os.path.join(self.folder, safe)
+
+    def _segment_path(self, video_id, size, index):
+        return os.path.join(self._dir(video_id), f"{size}-{index}.seg")
+
+    def align(self, offset):
+        return offset - offset % self.segment_size
+
+    # --- metadata ---
+
+    def meta(self, video_id):
+        try:
+            with open(os.path.join(self._dir(video_id), 'meta.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_meta(self, video_id, size, content_type):
+        meta = {'size': size, 'content_type': content_type}
+        folder = self._dir(video_id)
+        os.makedirs(folder, exist_ok=True)
+        self._write(os.path.join(folder, 'meta.json'), json.dumps(meta))
+        return meta
+
+    def drop(self, video_id):
+        """Forget everything about video_id (upstream started serving another file)."""
+        shutil.rmtree(self._dir(video_id), ignore_errors=True)
+
+    # --- segments ---
+
+    def _segment_length(self, index, size):
+        return min(self.segment_size, size - index * self.segment_size)
+
+    def has_segment(self, video_id, size, index):
+        return os.path.exists(self._segment_path(video_id, size, index))
+
+    def first_missing(self, video_id, size, start, end):
+        """Offset of the first segment in start..end that is not cached, None when all are."""
+        for index in range(start // self.segment_size, end // self.segment_size + 1):
+            if not self.has_segment(video_id, size, index):
+                return index * self.segment_size
+        return None
+
+    def covers(self, video_id, size, start, end):
+        return self.first_missing(video_id, size, start, end) is None
+
+    def read_segment(self, video_id, size, index):
+        path = self._segment_path(video_id, size, index)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # LRU: recently served segments survive eviction
+            return data
+        except OSError:
+            return None
+
+    def write_segment(self, video_id, size, index, data):
+        if self._write(self._segment_path(video_id, size, index), data):
+            self._lru.wrote(len(data))
+
+    def _write(self, path, data):
+        try:
+            atomic_write(path, data)
+            return True
+        except OSError as e:
+            print(f"[SegmentCache] Write failed for {path}: {e}")
+            return False
+
+    def evict(self):
+        """Drop least recently used segments until the cache is back under 90% of max_bytes."""
+        self._lru.evict()
+
+    def read(self, video_id, start, end, size, fetch):
+        """
+        Yield bytes start..end (inclusive) of a body of `size` bytes.
+        Cached segments are served from disk. Each run of missing segments is fetched with
+        fetch(first, last) -> iterable of bytes beginning at `first`, written back segment by
+        segment as it streams, and relayed to the caller.
+        """
+        seg = self.segment_size
+        pos = start
+        while pos <= end:
+            index = pos // seg
+            data = self.read_segment(video_id, size, index)
+            if data is not None:
+                chunk = data[pos - index * seg:end - index * seg + 1]
+                if not chunk: break  # Truncated segment, never loop forever
+                yield chunk
+                pos += len(chunk)
+                continue
+
+            # Fetch the whole run of missing segments in one upstream request
+            last_index = index
+            while (last_index + 1) * seg <= end and not self.has_segment(video_id, size, last_index + 1):
+                last_index += 1
+            first = index * seg
+            last = min((last_index + 1) * seg, size) - 1
+
+            buffer = bytearray()
+            buffer_start = first   # Absolute offset of buffer[0]
+            received = first       # Absolute offset of the next byte from upstream
+            body = fetch(first, last)
+            try:
+                for chunk in body:
+                    chunk = chunk[:last - received + 1]
+                    if not chunk: break
+
+                    # Relay the part the client asked for straight away
+                    chunk_end = received + len(chunk) - 1
+                    if pos <= end and received <= pos <= chunk_end:
+                        piece = chunk[pos - received:min(end, chunk_end) - received + 1]
+                        yield piece
+                        pos += len(piece)
+                    received += len(chunk)
+
+                    # Write back every segment that is now complete
+                    buffer += chunk
+                    while buffer:
+                        length = self._segment_length(buffer_start // seg, size)
+                        if len(buffer) < length: break
+                        self.write_segment(video_id, size, buffer_start // seg, bytes(buffer[:length]))
+                        del buffer[:length]
+                        buffer_start += length
+            finally:
+                close = getattr(body, 'close', None)
+                if close: close()
+
+            if pos <= min(end, last):
+                raise IOError(f"Upstream ended early at byte {pos} of {video_id}")
+
+segment_cache = SegmentCache(
+    os.path.join(Config.CACHE_FOLDER, 'segments'),
+    max_bytes=Config.SEGMENT_CACHE_MAX_BYTES,
+    segment_size=Config.SEGMENT_CACHE_SEGMENT_SIZE
+)
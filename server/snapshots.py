@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import hashlib
+import threading
+
+from flask import jsonify, request
+
+from server.config import Config
+from server.cache import SingleFlight, FileLock, atomic_write
+
+
+class SnapshotStore:
+    """
+    Precomputed JSON responses for pages that look the same for everyone (feed, discover, podcasts).
+    Builders are registered by name; a background thread per worker rebuilds any snapshot older
+    than Config.SNAPSHOT_INTERVAL (one worker at a time, under a file lock) and writes it to
+    <folder>/<name>.json for every worker. Requests only read the file. A snapshot that does not
+    exist yet is built once on the spot so a cold instance still answers.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        self._builders = {}
+        self._loaded = {}  # name -> (mtime, snapshot) as last read in this worker
+        self._builds = SingleFlight()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def register(self, name, build):
+        """build() returns the JSON-serializable payload, or raises (the old snapshot stays)."""
+        self._builders[name] = build
+
+    def _path(self, name):
+        return os.path.join(self.folder, f"{name}.json")
+
+    def _load(self, name):
+        path = self._path(name)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            return None
+        loaded = self._loaded.get(name)
+        if loaded and loaded[0] == mtime:
+            return loaded[1]
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return loaded[1] if loaded else None
+        self._loaded[name] = (mtime, snapshot)
+        return snapshot
+
+    def build(self, name):
+        payload = self._builders[name]()
+        body = json.dumps(payload, sort_keys=True)
+        snapshot = {'built_at': time.time(), 'etag': hashlib.sha1(body.encode('utf-8')).hexdigest(), 'payload': payload}
+
+        atomic_write(self._path(name), json.dumps(snapshot))
+        return snapshot
+
+    def get(self, name):
+        """{'built_at', 'etag', 'payload'} for name, built right now only if there has never been one."""
+        self.start()
+        snapshot = self._load(name)
+        if snapshot is None:
+            snapshot = self._builds.do(name, lambda: self.build(name))
+        return snapshot
+
+    def payload(self, name, default=None):
+        try:
+            return self.get(name)['payload']
+        except Exception as e:
+            print(f"[Snapshots] {name} unavailable: {e}")
+            return default
+
+    def response(self, name, default=None):
+        """The snapshot as a cacheable JSON response (ETag, Cache-Control, 304 on If-None-Match)."""
+        try:
+            snapshot = self.get(name)
+        except Exception as e:
+            print(f"[Snapshots] {name} unavailable: {e}")
+            return jsonify(default)
+        response = jsonify(snapshot['payload'])
+        response.set_etag(snapshot['etag'])
+        response.cache_control.public = True
+        response.cache_control.max_age = Config.SNAPSHOT_MAX_AGE
+        return response.make_conditional(request)
+
+    def refresh_stale(self):
+        for name in list(self._builders):
+            snapshot = self._load(name)
+            if snapshot and time.time() - snapshot['built_at'] < Config.SNAPSHOT_INTERVAL:
+                continue
+            with FileLock(f"snapshot:{name}", timeout=0) as lock:
+                if not lock.acquired: continue  # Another worker is on it
+                snapshot = self._load(name)
+                if snapshot and time.time() - snapshot['built_at'] < Config.SNAPSHOT_INTERVAL:
+                    continue
+                try:
+                    self._builds.do(name, lambda: self.build(name))
+                    print(f"[Snapshots] Rebuilt {name}")
+                except Exception as e:
+                    print(f"[Snapshots] Rebuilding {name} failed: {e}")
+
+    def _loop(self):
+        while True:
+            self.refresh_stale()
+            time.sleep(Config.SNAPSHOT_CHECK)
+
+    def start(self):
+        """Start this worker's refresh thread (once)."""
+        if self._thread is not None: return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name='snapshots', daemon=True)
+                self._thread.start()
+
+snapshots = SnapshotStore(os.path.join(Config.CACHE_FOLDER, 'snapshots'))
@@ -0,0 +1,127 @@
+import bisect
+import threading
+
+from server.config import Config
+
+
+def normalize(text):
+    return ' '.join(str(text).lower().split())
+
+
+class PrefixIndex:
+    """
+    In-memory prefix index for search suggestions, a sorted array searched with bisect.
+    Each phrase is stored under its normalized text and under its next few word starts,
+    so "lights" finds "Blinding Lights". Phrases carry a weight (how often we have seen them);
+    matches come back heaviest first. Bounded: the lightest phrases go when it is full.
+    Raw search queries only get in once they have been searched `min_query_count` times,
+    so a one-off typo never shows up as a suggestion.
+    """
+
+    MAX_WORD_STARTS = 4
+    SCAN_LIMIT = 256  # Matches looked at per lookup, keeps one-letter prefixes cheap
+
+    def __init__(self, max_phrases, min_query_count=1):
+        self.max_phrases = max_phrases
+        self.min_query_count = min_query_count
+        self._keys = []      # sorted "<searchable text>\0<phrase>"
+        self._phrases = {}   # normalized phrase -> [display text, weight]
+        self._queries = {}   # normalized query not indexed yet -> times searched
+        self._lock = threading.Lock()
+
+    @classmethod
+    def _keys_for(cls, phrase):
+        words = phrase.split(' ')
+        return [' '.join(words[i:]) + '\0' + phrase for i in range(min(len(words), cls.MAX_WORD_STARTS))]
+
+    def add(self, text, weight=1):
+        phrase = normalize(text)
+        if not phrase: return
+        with self._lock:
+            entry = self._phrases.get(phrase)
+            if entry:
+                entry[1] += weight
+                return
+            self._phrases[phrase] = [str(text).strip(), weight]
+            for key in self._keys_for(phrase):
+                bisect.insort(self._keys, key)
+            if len(self._phrases) > self.max_phrases:
+                self._shrink()
+
+    def add_many(self, texts):
+        """add() for a batch: new keys are appended and sorted once instead of inserted one by one."""
+        with self._lock:
+            new_keys = []
+            for text in texts:
+                phrase = normalize(text)
+                if not phrase: continue
+                entry = self._phrases.get(phrase)
+                if entry:
+                    entry[1] += 1
+                    continue
+                self._phrases[phrase] = [str(text).strip(), 1]
+                new_keys.extend(self._keys_for(phrase))
+            self._keys.extend(new_keys)
+            self._keys.sort()
+            if len(self._phrases) > self.max_phrases:
+                self._shrink()
+
+    def add_query(self, text, weight=2):
+        """Count a search. Known phrases gain weight right away, new ones once searched often enough."""
+        phrase = normalize(text)
+        if not phrase: return
+        with self._lock:
+            known = phrase in self._phrases
+            if not known:
+                count = self._queries.get(phrase, 0) + 1
+                if count < self.min_query_count:
+                    if len(self._queries) >= self.max_phrases:
+                        self._queries.clear()  # Crude bound; repeated queries come back quickly
+                    self._queries[phrase] = count
+                    return
+                self._queries.pop(phrase, None)
+        self.add(text, weight)
+
+    def _shrink(self):
+        # Drop the lightest tenth and rebuild, cheaper than removing keys one by one
+        keep = sorted(self._phrases.items(), key=lambda item: item[1][1], reverse=True)[:int(self.max_phrases * 0.9)]
+        self._phrases = dict(keep)
+        self._keys = sorted(key for phrase in self._phrases for key in self._keys_for(phrase))
+
+    def lookup(self, prefix, limit):
+        """Display texts of up to `limit` phrases with a word starting with `prefix`, heaviest first."""
+        prefix = normalize(prefix)
+        if not prefix: return []
+        with self._lock:
+            found = {}
+            i = bisect.bisect_left(self._keys, prefix)
+            while i < len(self._keys) and len(found) < self.SCAN_LIMIT:
+                key = self._keys[i]
+                if not key.startswith(prefix): break
+                phrase = key.split('\0', 1)[1]
+                found[phrase] = self._phrases[phrase]
+                i += 1
+        ranked = sorted(found.values(), key=lambda entry: entry[1], reverse=True)
+        return [display for display, _ in ranked[:limit]]
+
+    def __len__(self):
+        return len(self._phrases)
+
+
+# One per worker. Seeded from the Track table on first use, then grows with what users search for.
+suggestion_index = PrefixIndex(max_phrases=Config.SUGGEST_INDEX_MAX, min_query_count=Config.SUGGEST_MIN_QUERY_COUNT)
+_seeded = False
+_seed_lock = threading.Lock()
+
+def seed_from_tracks():
+    """Load local track titles into the index once per worker (needs an app context)."""
+    global _seeded
+    if _seeded: return
+    with _seed_lock:
+        if _seeded: return
+        from server.models import Track
+        try:
+            suggestion_index.add_many(title for (title,) in Track.query.with_entities(Track.title).all())
+        except Exception as e:
+            print(f"[Suggest] Could not load tracks: {e}")
+        _seeded = True
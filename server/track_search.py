@@ -0,0 +1,99 @@
+import re
+
+from server.cache import FileLock
+from server.models import db, Track
+
+# Title counts most, then artist, then genre/category, then description
+SQLITE_SETUP = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS track_fts USING fts5(
+        title, artist, genre, category, description,
+        content='track', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS track_fts_insert AFTER INSERT ON track BEGIN
+        INSERT INTO track_fts(rowid, title, artist, genre, category, description)
+        VALUES (new.id, new.title, new.artist, new.genre, new.category, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS track_fts_delete AFTER DELETE ON track BEGIN
+        INSERT INTO track_fts(track_fts, rowid, title, artist, genre, category, description)
+        VALUES ('delete', old.id, old.title, old.artist, old.genre, old.category, old.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS track_fts_update AFTER UPDATE ON track BEGIN
+        INSERT INTO track_fts(track_fts, rowid, title, artist, genre, category, description)
+        VALUES ('delete', old.id, old.title, old.artist, old.genre, old.category, old.description);
+        INSERT INTO track_fts(rowid, title, artist, genre, category, description)
+        VALUES (new.id, new.title, new.artist, new.genre, new.category, new.description);
+    END""",
+]
+# Index whatever was already in the table, only by the worker that created track_fts
+SQLITE_REBUILD = "INSERT INTO track_fts(track_fts) VALUES ('rebuild')"
+SQLITE_QUERY = """
+    SELECT rowid FROM track_fts WHERE track_fts MATCH :query
+    ORDER BY bm25(track_fts, 10.0, 5.0, 2.0, 2.0, 1.0) LIMIT :limit
+"""
+
+# A generated column: Postgres keeps it in sync on every insert and update by itself
+POSTGRES_SETUP = [
+    """ALTER TABLE track ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(artist, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(genre, '') || ' ' || coalesce(category, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'D')
+    ) STORED""",
+    "CREATE INDEX IF NOT EXISTS track_search_idx ON track USING GIN (search_vector)",
+]
+POSTGRES_QUERY = """
+    SELECT id FROM track WHERE search_vector @@ to_tsquery('simple', :query)
+    ORDER BY ts_rank(search_vector, to_tsquery('simple', :query)) DESC LIMIT :limit
+"""
+
+MAX_TERMS = 8
+
+# 'fts5', 'tsvector', or None (LIKE on title/artist) for this worker, set by setup_track_search()
+backend = None
+
+
+def setup_track_search():
+    """Create the full-text index for the database in use if it is missing (needs an app context)."""
+    global backend
+    dialect = db.engine.dialect.name
+    # Every worker runs this at startup: one at a time, so none of them trips over another's DDL
+    with FileLock('track_search', timeout=60):
+        if dialect == 'sqlite':
+            with db.engine.begin() as conn:
+                exists = conn.execute(db.text("SELECT 1 FROM sqlite_master WHERE name = 'track_fts'")).first()
+                if not exists:
+                    for statement in SQLITE_SETUP:
+                        conn.execute(db.text(statement))
+                    conn.execute(db.text(SQLITE_REBUILD))
+                    print("Created track_fts index")
+            backend = 'fts5'
+        elif dialect == 'postgresql':
+            with db.engine.begin() as conn:
+                for statement in POSTGRES_SETUP:
+                    conn.execute(db.text(statement))
+            backend = 'tsvector'
+
+
+def search_tracks(query, limit):
+    """Local Tracks matching every word of query (as a prefix), best first."""
+    terms = re.findall(r'\w+', query.lower())[:MAX_TERMS]
+    if not terms: return []
+
+    if backend == 'fts5':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        ids = [row[0] for row in db.session.execute(db.text(SQLITE_QUERY), {'query': match, 'limit': limit})]
+    elif backend == 'tsvector':
+        match = ' & '.join(f'{term}:*' for term in terms)
+        ids = [row[0] for row in db.session.execute(db.text(POSTGRES_QUERY), {'query': match, 'limit': limit})]
+    else:
+        patterns = [f"%{_escape_like(term)}%" for term in terms]
+        filters = [db.or_(Track.title.ilike(p, escape='\\'), Track.artist.ilike(p, escape='\\')) for p in patterns]
+        return Track.query.filter(*filters).limit(limit).all()
+
+    tracks = {t.id: t for t in Track.query.filter(Track.id.in_(ids)).all()} if ids else {}
+    return [tracks[i] for i in ids if i in tracks]
+
+
+def _escape_like(term):
+    # `_` is a word character, so it gets here and would match any character
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
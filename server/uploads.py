@@ -0,0 +1,158 @@
+import os
+import re
+import uuid
+import shutil
+import hashlib
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import mutagen
+except ImportError:  # Durations/tags then stay as the client sent them
+    mutagen = None
+
+from server.config import Config
+
+ALLOWED_EXTENSIONS = {'mp3', 'wav', 'ogg', 'm4a'}
+CHUNK_SIZE = 1024 * 1024
+RENDITION_FOLDER = os.path.join(Config.UPLOAD_FOLDER, 'renditions')
+os.makedirs(RENDITION_FOLDER, exist_ok=True)
+
+# Metadata + rendition jobs, off the request thread
+upload_executor = ThreadPoolExecutor(max_workers=Config.UPLOAD_WORKERS, thread_name_prefix='uploads')
+
+
+def store_upload(file, ext):
+    """
+    Copy an uploaded file into UPLOAD_FOLDER in chunks, hashing as it goes, and fsync it.
+    Returns (video_id, path, sha256 hex). The file only gets its final name once it is complete.
+    """
+    vid = str(uuid.uuid4())
+    path = os.path.join(Config.UPLOAD_FOLDER, f"{vid}.{ext}")
+    tmp_path = f"{path}.tmp"
+    digest = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk: break
+                digest.update(chunk)
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+    return vid, path, digest.hexdigest()
+
+
+def rendition_id(video_id):
+    """Id a rendition is streamed under. Never the original's id, so a URL always maps to the same bytes."""
+    return f"{video_id}_n"
+
+
+def rendition_path(stream_id):
+    return os.path.join(RENDITION_FOLDER, f"{stream_id}.m4a")
+
+
+def find_local_track(video_id):
+    """Path of the uploaded file or rendition with exactly this id, None for YouTube ids."""
+    if not re.match(r'^[A-Za-z0-9_-]+$', video_id):
+        return None
+    if os.path.isfile(rendition_path(video_id)):
+        return rendition_path(video_id)
+    for ext in ALLOWED_EXTENSIONS:
+        path = os.path.join(Config.UPLOAD_FOLDER, f"{video_id}.{ext}")
+        if os.path.isfile(path):
+            return path
+    return None
+
+
+def format_duration(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 60}:{seconds % 60:02d}"
+
+
+def read_metadata(path):
+    """{'duration', 'title', 'artist', 'genre'} that mutagen can read from the file (any may be missing)."""
+    if mutagen is None: return {}
+    audio = mutagen.File(path, easy=True)
+    if audio is None: return {}
+    meta = {}
+    if getattr(audio, 'info', None) and getattr(audio.info, 'length', 0):
+        meta['duration'] = format_duration(audio.info.length)
+    for tag in ('title', 'artist', 'genre'):
+        values = audio.get(tag) if audio.tags is not None else None
+        if values and str(values[0]).strip():
+            meta[tag] = str(values[0]).strip()
+    return meta
+
+
+def make_rendition(path, video_id):
+    """
+    Loudness-normalized AAC copy of the upload for streaming, kept only if it is smaller than the
+    original. Needs ffmpeg on PATH. Returns the rendition path or None.
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg: return None
+    out_path = rendition_path(rendition_id(video_id))
+    tmp_path = f"{out_path}.tmp.m4a"
+    try:
+        subprocess.run([
+            ffmpeg, '-nostdin', '-v', 'error', '-y', '-i', path, '-vn',
+            '-af', 'loudnorm=I=-14:TP=-1.5:LRA=11', '-ar', '44100', '-ac', '2',
+            '-c:a', 'aac', '-b:a', Config.UPLOAD_RENDITION_BITRATE, '-movflags', '+faststart', tmp_path
+        ], check=True, capture_output=True, timeout=Config.UPLOAD_PROCESS_TIMEOUT)
+        if os.path.getsize(tmp_path) >= os.path.getsize(path):
+            os.remove(tmp_path)
+            return None
+        os.replace(tmp_path, out_path)
+        return out_path
+    except (OSError, subprocess.SubprocessError) as e:
+        print(f"[Uploads] Rendition of {video_id} failed: {e}")
+        try: os.remove(tmp_path)
+        except OSError: pass
+        return None
+
+
+def process_upload(app, track_id, path, fill):
+    """
+    Background job: real duration and tags into the Track (tags only for the fields in `fill`,
+    the ones the uploader left empty), then the streaming rendition, recorded on the Track.
+    """
+    from server.models import db, Track
+    try:
+        meta = read_metadata(path)
+    except Exception as e:
+        print(f"[Uploads] Could not read tags of {path}: {e}")
+        meta = {}
+
+    if meta:
+        with app.app_context():
+            track = Track.query.get(track_id)
+            if track is None: return
+            if meta.get('duration'): track.duration = meta['duration']
+            for field in fill:
+                if meta.get(field): setattr(track, field, meta[field])
+            db.session.commit()
+
+    video_id = os.path.basename(path).rsplit('.', 1)[0]
+    rendition = make_rendition(path, video_id)
+    if rendition:
+        with app.app_context():
+            track = Track.query.get(track_id)
+            if track is not None:
+                track.rendition_id = rendition_id(video_id)
+                db.session.commit()
+    print(f"[Uploads] Processed {video_id}: {meta.get('duration', 'unknown length')}" + (", rendition ready" if rendition else ""))
+
+
+def submit_processing(app, track_id, path, fill):
+    def run():
+        try:
+            process_upload(app, track_id, path, fill)
+        except Exception as e:
+            print(f"[Uploads] Processing {path} failed: {e}")
+    upload_executor.submit(run)
@@ -0,0 +1,236 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from server.config import Config
+
+
+class HostScoreboard:
+    """
+    Per-host health learned from real traffic.
+    Keeps an EWMA of success rate and latency for every upstream we talk to, and a
+    circuit breaker that stops sending traffic to hosts that keep failing. After a
+    cooldown one request is let through (half-open); its outcome closes or reopens the breaker.
+    """
+
+    # Priors for hosts we have not heard from yet, keeps them roughly in their listed order
+    PRIOR_SUCCESS = 0.75
+    PRIOR_LATENCY = 1.5
+
+    def __init__(self, alpha=None, failure_threshold=None, cooldown=None, max_cooldown=None):
+        self.alpha = alpha or Config.UPSTREAM_EWMA_ALPHA
+        self.failure_threshold = failure_threshold or Config.UPSTREAM_BREAKER_THRESHOLD
+        self.cooldown = cooldown or Config.UPSTREAM_BREAKER_COOLDOWN
+        self.max_cooldown = max_cooldown or Config.UPSTREAM_BREAKER_MAX_COOLDOWN
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, host):
+        stats = self._hosts.get(host)
+        if stats is None:
+            stats = self._hosts[host] = {
+                'success': self.PRIOR_SUCCESS,
+                'latency': self.PRIOR_LATENCY,
+                'samples': 0,
+                'failures': 0,          # consecutive
+                'state': 'closed',      # closed -> open -> half_open -> closed/open
+                'opened_at': 0,
+                'cooldown': self.cooldown
+            }
+        return stats
+
+    def allow(self, host):
+        """True if a request to host may go out now. Claims the probe slot of a cooled-down open breaker."""
+        with self._lock:
+            stats = self._stats(host)
+            if stats['state'] == 'closed':
+                return True
+            if stats['state'] == 'open' and time.time() - stats['opened_at'] >= stats['cooldown']:
+                stats['state'] = 'half_open'
+                return True
+            return False
+
+    def record(self, host, ok, latency):
+        with self._lock:
+            stats = self._stats(host)
+            a = self.alpha
+            stats['success'] = (1 - a) * stats['success'] + a * (1.0 if ok else 0.0)
+            stats['latency'] = (1 - a) * stats['latency'] + a * latency
+            stats['samples'] += 1
+
+            if ok:
+                stats['failures'] = 0
+                stats['state'] = 'closed'
+                stats['cooldown'] = self.cooldown
+                return
+
+            stats['failures'] += 1
+            if stats['state'] == 'half_open':
+                # Probe failed: back off harder before the next one
+                stats['cooldown'] = min(stats['cooldown'] * 2, self.max_cooldown)
+                stats['state'] = 'open'
+                stats['opened_at'] = time.time()
+            elif stats['failures'] >= self.failure_threshold and stats['state'] == 'closed':
+                print(f"[Upstream] Circuit opened for {host} after {stats['failures']} failures")
+                stats['state'] = 'open'
+                stats['opened_at'] = time.time()
+
+    def release(self, host):
+        """Give back a half-open probe slot that ended without a verdict (e.g. cancelled)."""
+        with self._lock:
+            stats = self._hosts.get(host)
+            if stats and stats['state'] == 'half_open':
+                stats['state'] = 'open'
+                stats['opened_at'] = time.time() - stats['cooldown']
+
+    def score(self, host):
+        """Expected seconds until a usable answer from host (lower is better)."""
+        with self._lock:
+            stats = self._stats(host)
+            return stats['latency'] / max(stats['success'], 0.05)
+
+    def rank(self, hosts):
+        """Hosts whose breaker admits traffic, fastest expected answer first (ties keep list order)."""
+        usable = [h for h in hosts if self.is_available(h)]
+        return sorted(usable, key=self.score)
+
+    def is_available(self, host):
+        with self._lock:
+            stats = self._stats(host)
+            if stats['state'] == 'closed':
+                return True
+            return stats['state'] == 'open' and time.time() - stats['opened_at'] >= stats['cooldown']
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                host: {
+                    'success_rate': round(s['success'], 3),
+                    'latency_ewma': round(s['latency'], 3),
+                    'samples': s['samples'],
+                    'state': s['state']
+                } for host, s in self._hosts.items()
+            }
+
+# Shared by every request in this worker
+scoreboard = HostScoreboard()
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before this call could be made."""
+
+class Deadline:
+    """
+    Time budget for one request. Every upstream call asks it for a timeout, which
+    shrinks as the budget runs out; once too little is left calls are skipped.
+    Deadline(None) never expires.
+    """
+
+    # Not worth starting a call with less than this left
+    MIN_CALL_TIME = 0.25
+
+    def __init__(self, seconds):
+        self.expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def remaining(self):
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        remaining = self.remaining()
+        return remaining is not None and remaining < self.MIN_CALL_TIME
+
+    def timeout(self, cap):
+        """`cap` or whatever is left of the budget if that is less. Raises DeadlineExceeded when nothing useful is left."""
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+        if remaining < self.MIN_CALL_TIME:
+            raise DeadlineExceeded("Request time budget exhausted")
+        return min(cap, remaining)
+
+
+# --- Pooled keep-alive sessions ---
+# One requests.Session per upstream host so TCP+TLS handshakes are paid once per worker,
+# not once per call. Bounded because googlevideo hands out many distinct rN--- hosts.
+_sessions = OrderedDict()  # scheme://host -> Session
+_sessions_lock = threading.Lock()
+
+def _new_session():
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=1,
+        pool_maxsize=Config.UPSTREAM_POOL_SIZE,
+        max_retries=0
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Render/cloud environments have flaky CA bundles for some mirrors (see proxy_image)
+    session.verify = False
+    return session
+
+def get_session(url):
+    parts = urlsplit(url)
+    key = f"{parts.scheme}://{parts.netloc}"
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _sessions[key] = _new_session()
+            while len(_sessions) > Config.UPSTREAM_MAX_HOSTS:
+                _, evicted = _sessions.popitem(last=False)
+                evicted.close()
+        else:
+            _sessions.move_to_end(key)
+        return session
+
+def http_request(method, url, **kwargs):
+    kwargs.setdefault('timeout', (Config.UPSTREAM_CONNECT_TIMEOUT, Config.UPSTREAM_READ_TIMEOUT))
+    return get_session(url).request(method, url, **kwargs)
+
+def http_get(url, **kwargs):
+    return http_request('GET', url, **kwargs)
+
+def http_post(url, **kwargs):
+    return http_request('POST', url, **kwargs)
+
+def relay(resp, chunk_size=4096):
+    """Stream a response body and always hand its connection back to the pool (even on client disconnect)."""
+    try:
+        for chunk in resp.iter_content(chunk_size=chunk_size):
+            yield chunk
+    finally:
+        resp.close()
+
+if __name__ == '__main__':
+    # Benchmark: python -m server.upstream [url] [requests]
+    # Compares a fresh connection per call (old behaviour) with the pooled session.
+    url = sys.argv[1] if len(sys.argv) > 1 else "https://piped-instances.kavin.rocks/"
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    def timed(fetch):
+        samples = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            fetch(url, timeout=10, verify=False).close()
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    import urllib3
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+    http_get(url, timeout=10).close()  # Warm the pool, that handshake is paid once per worker
+    fresh = timed(requests.get)
+    pooled = timed(http_get)
+
+    fresh_ms = sum(fresh) / rounds * 1000
+    pooled_ms = sum(pooled) / rounds * 1000
+    print(f"{url} x{rounds}")
+    print(f"  fresh connection : {fresh_ms:8.1f} ms/request")
+    print(f"  pooled keep-alive: {pooled_ms:8.1f} ms/request")
+    print(f"  handshake saved  : {fresh_ms - pooled_ms:8.1f} ms/request")
@@ -0,0 +1,130 @@
+import sys
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from server.config import Config
+
+# --- Runs inside the extractor processes ---
+
+# One long-lived YoutubeDL per player_client and process: extractor state (player JS,
+# signature functions, cookies) is reused between videos instead of rebuilt per attempt
+_extractors = {}
+
+def _get_extractor(player_client):
+    from yt_dlp import YoutubeDL
+    ydl = _extractors.get(player_client)
+    if ydl is None:
+        ydl = _extractors[player_client] = YoutubeDL({
+            'quiet': True,
+            'format': 'bestaudio/best',
+            'nocheckcertificate': True,
+            # A stalled connection fails the extraction instead of holding this process forever
+            'socket_timeout': Config.YTDLP_SOCKET_TIMEOUT,
+            'extractor_args': {'youtube': {'player_client': [player_client]}}
+        })
+    return ydl
+
+class VideoUnavailable(Exception):
+    """yt-dlp refused the video itself (unavailable, private, removed...), not a client/network problem."""
+
+def _extract(player_client, video_id):
+    try:
+        info = _get_extractor(player_client).extract_info(video_id, download=False)
+    except Exception as e:
+        # yt-dlp errors carry unpicklable state, only the message crosses the process boundary.
+        # "Expected" extractor errors are about the video, except the bot check (that's us being blocked).
+        message = str(e)
+        cause = e.exc_info[1] if getattr(e, 'exc_info', None) else e
+        if getattr(cause, 'expected', False) and 'bot' not in message.lower():
+            raise VideoUnavailable(message) from None
+        raise RuntimeError(message) from None
+    return info.get('url')
+
+# --- Request side ---
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            kwargs = {}
+            if sys.version_info >= (3, 11):
+                # Recycle children now and then so extractor memory can't grow forever
+                kwargs['max_tasks_per_child'] = Config.YTDLP_MAX_TASKS_PER_CHILD
+            # spawn: gunicorn workers are threaded by now, forking them is not safe
+            _pool = ProcessPoolExecutor(
+                max_workers=Config.YTDLP_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+                **kwargs
+            )
+        return _pool
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def _kill_pool(pool):
+    """Discard the pool and terminate its processes, the only way to stop an extraction that is already running."""
+    processes = list((getattr(pool, '_processes', None) or {}).values())  # shutdown() forgets them
+    _discard_pool(pool)
+    for process in processes:
+        try: process.terminate()
+        except Exception: pass
+
+def _watch(pool, future):
+    # The caller gave up on (or no longer needs) a running extraction: give it YTDLP_TIMEOUT more, then recycle the pool
+    # if it is still stuck, so hung tasks can't take all YTDLP_PROCESSES slots for good
+    def check():
+        if not future.done():
+            print(f"[yt-dlp] Extraction still running after {Config.YTDLP_TIMEOUT:g}s, recycling the pool")
+            _kill_pool(pool)
+    timer = threading.Timer(Config.YTDLP_TIMEOUT, check)
+    timer.daemon = True
+    timer.start()
+
+def extract_audio_url(player_client, video_id, timeout=None, cancel=None):
+    """
+    Audio URL for video_id via yt-dlp, extracted in the process pool so page parsing
+    never holds this worker's GIL. Raises TimeoutError after `timeout` seconds.
+    Returns None as soon as the `cancel` event is set (another attempt won the race).
+    """
+    timeout = Config.YTDLP_TIMEOUT if timeout is None else timeout
+    pool = get_pool()
+    try:
+        future = pool.submit(_extract, player_client, video_id)
+    except (BrokenProcessPool, RuntimeError):
+        _discard_pool(pool)
+        pool = get_pool()
+        future = pool.submit(_extract, player_client, video_id)
+
+    deadline = time.monotonic() + timeout
+    try:
+        # Short slices, so a cancelled attempt lets go of its resolver thread right away
+        while True:
+            if cancel is not None and cancel.is_set():
+                _abandon(pool, future)
+                return None
+            remaining = deadline - time.monotonic()
+            try:
+                return future.result(timeout=max(0, min(0.25, remaining)))
+            except FutureTimeout:
+                if remaining <= 0.25: raise
+    except FutureTimeout:
+        _abandon(pool, future)
+        raise TimeoutError(f"yt-dlp ({player_client}) took longer than {timeout:g}s")
+    except BrokenProcessPool:
+        # A child died (OOM, segfault): start a fresh pool for the next caller
+        _discard_pool(pool)
+        raise
+
+def _abandon(pool, future):
+    if not future.cancel():  # Only works while it is still queued
+        _watch(pool, future)